@@ -4,15 +4,78 @@ Endpoints específicos para Alquería según especificación DATOS_BACKEND_RAILW
 Compatible con 734 documentos vectorizados en alqueria-rag-index
 """
 
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from functools import lru_cache
 import os
-from datetime import datetime
+import hashlib
+import json
+import threading
+import time
+import orjson
+
+from core.azure_search_vector_store import AzureSearchVectorStore
 
 router = APIRouter(prefix="/api/v1/alqueria", tags=["Alquería RAG"])
 
+ALQUERIA_CONFIG_PATH = "config/alqueria_config.json"
+_vector_store_lock = threading.Lock()
+_UTC_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+def _utc_timestamp() -> str:
+    """Timestamp ISO-8601 en UTC con resolución de segundos"""
+    return time.strftime(_UTC_TIMESTAMP_FORMAT, time.gmtime())
+
+# Caché de respuestas /search ya serializadas: entradas máximas y segundos de vida
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 900
+
+class _TTLCache:
+    """Caché LRU con expiración por entrada, segura entre hilos"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+_search_response_cache = _TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+def _search_cache_key(request: "AlqueriaSearchRequest", max_results: int) -> tuple:
+    """(query, hash de filtros, max_results); la query se usa tal cual porque se devuelve en la respuesta"""
+    filters = orjson.dumps(request.filters or {}, option=orjson.OPT_SORT_KEYS, default=str)
+    return request.query, hashlib.blake2b(filters, digest_size=16).digest(), max_results
+
 # Modelos Pydantic para requests/responses
+# Los modelos de resultado son inmutables: si se validan, Pydantic reutiliza las instancias sin copiarlas
+_RESULT_MODEL_CONFIG = ConfigDict(frozen=True, extra="ignore", revalidate_instances="never")
+
 class AlqueriaSearchRequest(BaseModel):
     """Request para búsqueda RAG específica de Alquería"""
     query: str = Field(..., description="Consulta sobre datos de Alquería")
@@ -26,6 +89,8 @@ class AlqueriaSearchRequest(BaseModel):
 
 class DocumentMetadata(BaseModel):
     """Metadata del documento fuente"""
+    model_config = _RESULT_MODEL_CONFIG
+
     document_name: str
     document_type: str  # asi_live, kantar_panel, concept_testing, cualitativo, intuito
     provider: List[str]  # ["asi", "kantar", "intuito", "bht"]
@@ -37,6 +102,8 @@ class DocumentMetadata(BaseModel):
 
 class ChunkMetadata(BaseModel):
     """Metadata del chunk específico"""
+    model_config = _RESULT_MODEL_CONFIG
+
     section_title: str
     content_type: str  # table, data, insights, methodology, demographics, narrative
     key_concepts: List[str]
@@ -45,6 +112,8 @@ class ChunkMetadata(BaseModel):
 
 class SearchResult(BaseModel):
     """Resultado individual de búsqueda"""
+    model_config = _RESULT_MODEL_CONFIG
+
     id: str
     content: str
     score: float
@@ -92,9 +161,38 @@ class IndexStats(BaseModel):
     content_distribution: Dict[str, int]
     provider_distribution: Dict[str, int]
 
+# Vector store compartido por todas las peticiones
+@lru_cache(maxsize=1)
+def _build_vector_store() -> AzureSearchVectorStore:
+    """Carga la configuración de Alquería y construye el vector store una sola vez"""
+    try:
+        with open(ALQUERIA_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Archivo de configuración no encontrado: {ALQUERIA_CONFIG_PATH}"
+        )
+    except json.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al parsear configuración: {str(e)}"
+        )
+
+    return AzureSearchVectorStore(config)
+
+def get_vector_store() -> AzureSearchVectorStore:
+    """
+    Dependencia FastAPI que entrega el AzureSearchVectorStore del proceso.
+    Los errores de configuración no se cachean, así que se reintenta en la siguiente petición.
+    """
+    with _vector_store_lock:
+        return _build_vector_store()
+
 # Endpoints principales
-@router.post("/search", response_model=AlqueriaSearchResponse)
-def search_alqueria_data(request: AlqueriaSearchRequest):
+@router.post("/search", response_model=AlqueriaSearchResponse, response_class=ORJSONResponse)
+def search_alqueria_data(request: AlqueriaSearchRequest,
+                         vector_store: AzureSearchVectorStore = Depends(get_vector_store)):
     """
     Búsqueda principal en los datos de Alquería
 
@@ -105,65 +203,52 @@ def search_alqueria_data(request: AlqueriaSearchRequest):
     - Estudios cualitativos
     - Intuito research
     """
-    start_time = datetime.now()
+    start_time = time.perf_counter_ns()
 
     try:
-        # Importar aquí para evitar circular imports
-        from core.azure_search_vector_store import AzureSearchVectorStore
-        import json
-
-        # Cargar configuración de Alquería
-        config_path = "config/alqueria_config.json"
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except FileNotFoundError:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Archivo de configuración no encontrado: {config_path}"
-            )
-        except json.JSONDecodeError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error al parsear configuración: {str(e)}"
-            )
-
-        vector_store = AzureSearchVectorStore(config)
+        max_results = request.options.get("max_results", 10)
+
+        # Una consulta idéntica reciente se sirve sin embedding ni búsqueda
+        cache_key = _search_cache_key(request, max_results)
+        cached = _search_response_cache.get(cache_key)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
 
         # Realizar búsqueda vectorial
-        max_results = request.options.get("max_results", 10)
         search_documents = vector_store.similarity_search(
             query=request.query,
             k=max_results,
-            filter_metadata=request.filters or {}
+            metadata_filter=request.filters or {}
         )
 
         # Convertir a formato de respuesta esperado
+        # (dicts planos con la forma de SearchResult: los datos vienen de nuestro propio
+        # vector store, así que no se construyen ni re-validan modelos Pydantic)
         search_results = []
-        for doc in search_documents:
-            result = SearchResult(
-                id=doc.id,
-                content=doc.content,
-                score=doc.score,
-                document_metadata=DocumentMetadata(
-                    document_name=doc.metadata.get("document_name", "Unknown"),
-                    document_type=doc.metadata.get("document_type", "unknown"),
-                    provider=[doc.metadata.get("provider", "unknown")],
-                    study_period=[doc.metadata.get("study_period", "unknown")],
-                    sample_size=doc.metadata.get("sample_size", 0),
-                    methodology=[doc.metadata.get("methodology", "unknown")],
-                    target_audience=doc.metadata.get("target_audience", ""),
-                    competitive_brands=doc.metadata.get("competitive_brands", [])
-                ),
-                chunk_metadata=ChunkMetadata(
-                    section_title=doc.metadata.get("section_title", ""),
-                    content_type=doc.metadata.get("content_type", "unknown"),
-                    key_concepts=doc.metadata.get("key_concepts", []),
-                    has_numbers=doc.metadata.get("has_numbers", False),
-                    word_count=len(doc.content.split())
-                )
-            )
-            search_results.append(result)
+        for doc, _ in search_documents:
+            metadata = doc.metadata
+            search_results.append({
+                "id": doc.id,
+                "content": doc.content,
+                "score": doc.score,
+                "document_metadata": {
+                    "document_name": metadata.get("document_name", "Unknown"),
+                    "document_type": metadata.get("document_type", "unknown"),
+                    "provider": [metadata.get("provider", "unknown")],
+                    "study_period": [metadata.get("study_period", "unknown")],
+                    "sample_size": metadata.get("sample_size", 0),
+                    "methodology": [metadata.get("methodology", "unknown")],
+                    "target_audience": metadata.get("target_audience", ""),
+                    "competitive_brands": metadata.get("competitive_brands", [])
+                },
+                "chunk_metadata": {
+                    "section_title": metadata.get("section_title", ""),
+                    "content_type": metadata.get("content_type", "unknown"),
+                    "key_concepts": metadata.get("key_concepts", []),
+                    "has_numbers": metadata.get("has_numbers", False),
+                    "word_count": len(doc.content.split())
+                }
+            })
 
         # Generar respuesta simple
         answer_text = f"He encontrado {len(search_results)} resultados relacionados con tu consulta sobre '{request.query}'.\n\n"
@@ -171,37 +256,92 @@ def search_alqueria_data(request: AlqueriaSearchRequest):
         if search_results:
             answer_text += "**Información encontrada:**\n"
             for i, result in enumerate(search_results[:3], 1):
-                answer_text += f"{i}. {result.content[:200]}...\n\n"
+                answer_text += f"{i}. {result['content'][:200]}...\n\n"
 
             answer_text += f"*Fuentes: {len(search_results)} documentos de estudios de Alquería*"
         else:
             answer_text += "No se encontraron resultados específicos en los documentos de Alquería para esta consulta."
 
-        llm_response = LLMResponse(
-            answer=answer_text,
-            confidence=0.8 if search_results else 0.3,
-            sources_used=len(search_results)
-        )
+        llm_response = {
+            "answer": answer_text,
+            "confidence": 0.8 if search_results else 0.3,
+            "sources_used": len(search_results)
+        }
 
         # Calcular tiempo de procesamiento
-        processing_time = (datetime.now() - start_time).total_seconds() * 1000
+        processing_time_ms = (time.perf_counter_ns() - start_time) // 1_000_000
 
         # Generar sugerencias inteligentes
         suggestions = generate_intelligent_suggestions(request.query, search_results)
 
-        return AlqueriaSearchResponse(
-            success=True,
-            query=request.query,
-            results=search_results,
-            total_results=len(search_results),
-            processing_time_ms=int(processing_time),
-            llm_response=llm_response,
-            suggestions=suggestions
-        )
+        response = {
+            "success": True,
+            "query": request.query,
+            "results": search_results,
+            "total_results": len(search_results),
+            "processing_time_ms": processing_time_ms,
+            "llm_response": llm_response,
+            "suggestions": suggestions
+        }
+
+        # Devolver el Response directamente evita que FastAPI valide de nuevo todo el árbol;
+        # AlqueriaSearchResponse sigue documentando el esquema en OpenAPI
+        body = orjson.dumps(response, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+        # Sin resultados puede ser un fallo transitorio de Azure: no se cachea
+        if search_results:
+            _search_response_cache.set(cache_key, body)
+
+        return Response(content=body, media_type="application/json")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en búsqueda: {str(e)}")
 
+# Datos reales basados en la especificación - estáticos, se serializan una sola vez al importar
+_FILTERS_BYTES = orjson.dumps(AvailableFilters(
+    document_type=[
+        FilterOption(value="asi_live", count=132, label="ASI Live"),
+        FilterOption(value="kantar_panel", count=252, label="Kantar Panel"),
+        FilterOption(value="concept_testing", count=247, label="Test de Concepto"),
+        FilterOption(value="cualitativo", count=70, label="Cualitativo"),
+        FilterOption(value="intuito", count=148, label="Intuito")
+    ],
+    provider=[
+        FilterOption(value="asi", count=450, label="ASI"),
+        FilterOption(value="kantar", count=252, label="Kantar"),
+        FilterOption(value="intuito", count=148, label="Intuito"),
+        FilterOption(value="bht", count=132, label="BHT")
+    ],
+    methodology=[
+        FilterOption(value="quantitative", count=400, label="Cuantitativo"),
+        FilterOption(value="qualitative", count=350, label="Cualitativo"),
+        FilterOption(value="panel", count=252, label="Panel"),
+        FilterOption(value="concept_test", count=247, label="Test de Concepto")
+    ],
+    content_type=[
+        FilterOption(value="data", count=250, label="Datos/Números"),
+        FilterOption(value="insights", count=180, label="Insights"),
+        FilterOption(value="table", count=150, label="Tablas"),
+        FilterOption(value="demographics", count=80, label="Demografía"),
+        FilterOption(value="methodology", count=40, label="Metodología"),
+        FilterOption(value="narrative", count=34, label="Narrativo")
+    ],
+    competitive_brands=[
+        FilterOption(value="Colanta", count=320),
+        FilterOption(value="Nestlé", count=280),
+        FilterOption(value="Parmalat", count=250),
+        FilterOption(value="Finesse", count=180)
+    ],
+    key_concepts=[
+        FilterOption(value="penetracion", count=180),
+        FilterOption(value="frecuencia", count=150),
+        FilterOption(value="volumen", count=120),
+        FilterOption(value="switching", count=100),
+        FilterOption(value="lealtad", count=90),
+        FilterOption(value="satisfaccion", count=80)
+    ]
+).model_dump())
+
 @router.get("/filters", response_model=AvailableFilters)
 async def get_available_filters():
     """
@@ -213,53 +353,35 @@ async def get_available_filters():
     - Metodologías (cuanti, cuali, panel, concept test)
     - Tipos de contenido (data, insights, tablas, etc.)
     """
-
-    # Datos reales basados en la especificación
-    filters = AvailableFilters(
-        document_type=[
-            FilterOption(value="asi_live", count=132, label="ASI Live"),
-            FilterOption(value="kantar_panel", count=252, label="Kantar Panel"),
-            FilterOption(value="concept_testing", count=247, label="Test de Concepto"),
-            FilterOption(value="cualitativo", count=70, label="Cualitativo"),
-            FilterOption(value="intuito", count=148, label="Intuito")
-        ],
-        provider=[
-            FilterOption(value="asi", count=450, label="ASI"),
-            FilterOption(value="kantar", count=252, label="Kantar"),
-            FilterOption(value="intuito", count=148, label="Intuito"),
-            FilterOption(value="bht", count=132, label="BHT")
-        ],
-        methodology=[
-            FilterOption(value="quantitative", count=400, label="Cuantitativo"),
-            FilterOption(value="qualitative", count=350, label="Cualitativo"),
-            FilterOption(value="panel", count=252, label="Panel"),
-            FilterOption(value="concept_test", count=247, label="Test de Concepto")
-        ],
-        content_type=[
-            FilterOption(value="data", count=250, label="Datos/Números"),
-            FilterOption(value="insights", count=180, label="Insights"),
-            FilterOption(value="table", count=150, label="Tablas"),
-            FilterOption(value="demographics", count=80, label="Demografía"),
-            FilterOption(value="methodology", count=40, label="Metodología"),
-            FilterOption(value="narrative", count=34, label="Narrativo")
-        ],
-        competitive_brands=[
-            FilterOption(value="Colanta", count=320),
-            FilterOption(value="Nestlé", count=280),
-            FilterOption(value="Parmalat", count=250),
-            FilterOption(value="Finesse", count=180)
-        ],
-        key_concepts=[
-            FilterOption(value="penetracion", count=180),
-            FilterOption(value="frecuencia", count=150),
-            FilterOption(value="volumen", count=120),
-            FilterOption(value="switching", count=100),
-            FilterOption(value="lealtad", count=90),
-            FilterOption(value="satisfaccion", count=80)
-        ]
-    )
-
-    return filters
+    return Response(content=_FILTERS_BYTES, media_type="application/json")
+
+# Estadísticas pre-serializadas; solo last_updated cambia por request
+_LAST_UPDATED_MARKER = "__LAST_UPDATED__"
+_STATS_PREFIX, _STATS_SUFFIX = orjson.dumps(IndexStats(
+    total_documents=734,
+    total_source_files=6,
+    index_size_mb=45.2,
+    last_updated=_LAST_UPDATED_MARKER,
+    quality_distribution={
+        "high": 734,
+        "medium": 0,
+        "low": 0
+    },
+    content_distribution={
+        "data": 220,
+        "insights": 180,
+        "narrative": 160,
+        "table": 120,
+        "demographics": 30,
+        "methodology": 24
+    },
+    provider_distribution={
+        "asi": 450,
+        "kantar": 252,
+        "intuito": 148,
+        "bht": 132
+    }
+).model_dump()).split(_LAST_UPDATED_MARKER.encode())
 
 @router.get("/stats", response_model=IndexStats)
 async def get_index_stats():
@@ -268,34 +390,19 @@ async def get_index_stats():
 
     Información sobre los 734 documentos vectorizados
     """
+    timestamp = _utc_timestamp().encode()
+    return Response(content=_STATS_PREFIX + timestamp + _STATS_SUFFIX, media_type="application/json")
 
-    stats = IndexStats(
-        total_documents=734,
-        total_source_files=6,
-        index_size_mb=45.2,
-        last_updated=datetime.utcnow().isoformat() + "Z",
-        quality_distribution={
-            "high": 734,
-            "medium": 0,
-            "low": 0
-        },
-        content_distribution={
-            "data": 220,
-            "insights": 180,
-            "narrative": 160,
-            "table": 120,
-            "demographics": 30,
-            "methodology": 24
-        },
-        provider_distribution={
-            "asi": 450,
-            "kantar": 252,
-            "intuito": 148,
-            "bht": 132
-        }
-    )
+@router.post("/cache/clear")
+def clear_search_caches(vector_store: AzureSearchVectorStore = Depends(get_vector_store)):
+    """
+    Vacía los cachés de búsqueda (respuestas /search y caché semántico)
 
-    return stats
+    Llamar después de reindexar alqueria-rag-index para que los cambios se vean sin reiniciar
+    """
+    _search_response_cache.clear()
+    vector_store.clear_caches()
+    return {"status": "cleared", "timestamp": _utc_timestamp()}
 
 @router.get("/health")
 async def health_check():
@@ -311,47 +418,55 @@ async def health_check():
             "search_service": search_service,
             "search_index": search_index,
             "documents_available": 734,
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": _utc_timestamp(),
             "version": "1.0.0"
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "error": str(e),
-            "timestamp": datetime.utcnow().isoformat() + "Z"
+            "timestamp": _utc_timestamp()
         }
 
 # Funciones auxiliares
+_BASE_SUGGESTIONS = (
+    "¿Cómo se compara con la competencia?",
+    "¿Cuál es la tendencia histórica?",
+    "¿Qué factores influyen en este comportamiento?",
+    "¿Hay diferencias por segmento demográfico?",
+    "¿Qué oportunidades de mejora existen?"
+)
+
+_COMPETENCIA_SUGGESTIONS = (
+    "¿Cuáles son las fortalezas vs competencia?",
+    "¿Qué estrategias usa la competencia?",
+    "¿Dónde puede ganar Alquería?"
+)
+
+# Palabra clave -> sugerencias; el orden del dict define la prioridad
+_KEYWORD_MAP = {
+    "penetración": (
+        "¿Cómo varía la penetración por edad?",
+        "¿Cuál es la penetración vs competencia?",
+        "¿Qué factores impactan la penetración?"
+    ),
+    "competencia": _COMPETENCIA_SUGGESTIONS,
+    "vs": _COMPETENCIA_SUGGESTIONS,
+    "switching": (
+        "¿Hacia qué marcas se van los consumidores?",
+        "¿Qué motiva el cambio de marca?",
+        "¿Cómo retener mejor a los consumidores?"
+    )
+}
+
 def generate_intelligent_suggestions(query: str, results: List[Dict]) -> List[str]:
     """
     Genera sugerencias inteligentes basadas en el query y resultados
     """
-    base_suggestions = [
-        "¿Cómo se compara con la competencia?",
-        "¿Cuál es la tendencia histórica?",
-        "¿Qué factores influyen en este comportamiento?",
-        "¿Hay diferencias por segmento demográfico?",
-        "¿Qué oportunidades de mejora existen?"
-    ]
-
     # Lógica más inteligente basada en el query
-    if "penetración" in query.lower():
-        return [
-            "¿Cómo varía la penetración por edad?",
-            "¿Cuál es la penetración vs competencia?",
-            "¿Qué factores impactan la penetración?"
-        ]
-    elif "competencia" in query.lower() or "vs" in query.lower():
-        return [
-            "¿Cuáles son las fortalezas vs competencia?",
-            "¿Qué estrategias usa la competencia?",
-            "¿Dónde puede ganar Alquería?"
-        ]
-    elif "switching" in query.lower():
-        return [
-            "¿Hacia qué marcas se van los consumidores?",
-            "¿Qué motiva el cambio de marca?",
-            "¿Cómo retener mejor a los consumidores?"
-        ]
-
-    return base_suggestions[:3]
\ No newline at end of file
+    ql = query.lower()
+    for keyword, suggestions in _KEYWORD_MAP.items():
+        if keyword in ql:
+            return list(suggestions)
+
+    return list(_BASE_SUGGESTIONS[:3])
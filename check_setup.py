@@ -3,9 +3,13 @@
 Script para verificar el estado de las dependencias del sistema Tigo RAG
 """
 
+import os
 import sys
 import subprocess
 
+# pip install solo si se pide explícitamente: nunca en un arranque no interactivo (p.ej. Azure App Service)
+ALLOW_RUNTIME_INSTALL = os.getenv("ALLOW_RUNTIME_INSTALL") == "1"
+
 def check_package(package_name):
     """Verificar si un paquete está instalado"""
     try:
@@ -24,9 +28,10 @@ def install_package(package):
     except subprocess.CalledProcessError:
         return False
 
-def main():
-    print("🔍 Verificando dependencias del sistema Tigo RAG...")
-    print("=" * 60)
+def main(quiet=False):
+    if not quiet:
+        print("🔍 Verificando dependencias del sistema Tigo RAG...")
+        print("=" * 60)
     
     # Lista de paquetes críticos para el funcionamiento básico
     critical_packages = [
@@ -61,14 +66,18 @@ def main():
         print("❌ DEPENDENCIAS CRÍTICAS FALTANTES:")
         for pkg in critical_missing:
             print(f"   - {pkg}")
-        print("\n🔧 Intentando instalar dependencias críticas...")
         
-        for pkg in critical_missing:
-            print(f"   Instalando {pkg}...")
-            if install_package(pkg):
-                print(f"   ✅ {pkg} instalado")
-            else:
-                print(f"   ❌ Error instalando {pkg}")
+        if ALLOW_RUNTIME_INSTALL:
+            print("\n🔧 Intentando instalar dependencias críticas...")
+            
+            for pkg in critical_missing:
+                print(f"   Instalando {pkg}...")
+                if install_package(pkg):
+                    print(f"   ✅ {pkg} instalado")
+                else:
+                    print(f"   ❌ Error instalando {pkg}")
+        else:
+            print("\n⚠️  Instalación automática desactivada (usa ALLOW_RUNTIME_INSTALL=1 para habilitarla)")
     else:
         print("✅ TODAS LAS DEPENDENCIAS CRÍTICAS ESTÁN DISPONIBLES")
     
@@ -97,6 +106,9 @@ def main():
     except Exception as e:
         print(f"❌ Error verificando configuración: {e}")
     
+    if quiet:
+        return len(critical_missing) == 0
+    
     print("\n🚀 SIGUIENTE PASO:")
     if not critical_missing:
         print("   ✅ El sistema puede iniciarse!")
@@ -109,5 +121,5 @@ def main():
     return len(critical_missing) == 0
 
 if __name__ == "__main__":
-    success = main()
+    success = main(quiet="--quiet" in sys.argv[1:])
     sys.exit(0 if success else 1)
\ No newline at end of file
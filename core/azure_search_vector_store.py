@@ -5,37 +5,252 @@ Uses Azure AI Search for vector search (like the Vercel system)
 """
 
 import os
-import json
+import logging
+import time
+import queue
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache, lru_cache
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from dataclasses import dataclass, field
 
+try:
+    import numpy as np
+except ImportError:  # Azure App Service deployments run without numpy
+    np = None
 
-@dataclass
+
+logger = logging.getLogger(__name__)
+
+# Environment is read once per process (main.py loads .env before importing this module)
+_SEARCH_SERVICE = os.getenv("AZURE_SEARCH_SERVICE", "insightgenius-search")
+_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
+_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX", "alqueria-rag-index")
+_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+
+# Max distinct query texts whose embeddings are kept in memory per store
+EMBEDDING_CACHE_SIZE = 4096
+
+# Semantic cache: previous queries kept, and cosine similarity needed to reuse their results
+SEMANTIC_CACHE_SIZE = 1024
+SEMANTIC_CACHE_THRESHOLD = 0.97
+# Seconds a cached result stays valid, so reindexed documents show up without a restart
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "900"))
+# Rows dequantized per step when scanning the int8 cache (bounds the float32 scratch buffer)
+SEMANTIC_CACHE_SCAN_BLOCK = 256
+
+# Embedding micro-batching: max texts per API call, and how long (seconds) to wait for more
+EMBEDDING_BATCH_SIZE = 16
+EMBEDDING_BATCH_WINDOW = 0.005
+# Batches in flight at once (a slow API call does not hold back the next batch), and HTTP timeout
+EMBEDDING_BATCH_WORKERS = 4
+EMBEDDING_REQUEST_TIMEOUT = 30
+
+
+@dataclass(slots=True)
 class SearchDocument:
     """Search document from Azure AI Search"""
     id: str
     content: str
-    metadata: Dict[str, Any]
+    raw: Dict[str, Any]
     score: float
+    _metadata: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
     
     @classmethod
     def from_search_result(cls, result: Dict[str, Any]) -> 'SearchDocument':
-        return cls(
-            id=result.get("id", ""),
-            content=result.get("content", ""),
-            metadata={
-                "client": result.get("client_name", result.get("client", "")),
-                "study": result.get("title", result.get("study", "")),
-                "year": result.get("year", ""),
-                "section_type": result.get("study_type", result.get("section_type", "")),
-                "document_name": result.get("title", result.get("study", "Unknown")),
-                "brands": result.get("brands", ""),
-                "categories": result.get("categories", "")
-            },
-            score=result.get("@search.score", 0.0)
-        )
+        get = result.get
+        return cls(get("id", ""), get("content", ""), result, get("@search.score", 0.0))
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Normalized metadata, built from the raw hit on first access"""
+        if self._metadata is None:
+            # Azure returns null for selected-but-empty fields, so fall back on any falsy value
+            get = self.raw.get
+            title = get("title") or get("study")
+            self._metadata = {
+                "client": get("client_name") or get("client") or "",
+                "study": title or "",
+                "year": get("year", ""),
+                "section_type": get("study_type") or get("section_type") or "",
+                "document_name": title or "Unknown",
+                "brands": get("brands", ""),
+                "categories": get("categories", "")
+            }
+        return self._metadata
+
+
+class SemanticQueryCache:
+    """
+    In-process cache of raw search results keyed by query embedding.
+    A paraphrased query whose embedding is nearly identical to a previous one
+    reuses that query's results instead of hitting Azure AI Search again.
+    Embeddings are stored scalar-quantized to int8 with a per-row scale
+    (4x less memory than float32). Entries expire after `ttl` seconds; call clear()
+    when the underlying index changes. Disabled (always misses) when numpy is not installed.
+    """
+    
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors: Optional["np.ndarray"] = None  # (max_entries, dims) int8, quantized L2-normalized rows
+        self._scales: Optional["np.ndarray"] = None   # (max_entries,) float32, row ≈ int8 row * scale
+        self._expires_at: Optional["np.ndarray"] = None  # (max_entries,) float64, time.monotonic() deadline
+        self._keys: List[Any] = []
+        self._payloads: List[Any] = []
+        self._last_used = [0] * max_entries
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.enabled = np is not None
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> "np.ndarray":
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+    
+    def lookup(self, embedding: List[float], key: Any) -> Optional[Any]:
+        """Return the payload of the most similar cached query with the same key, if any"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            size = len(self._payloads)
+            if not size or self._vectors.shape[1] != len(embedding):
+                return None
+            
+            query = self._normalize(embedding)
+            sims = np.empty(size, dtype=np.float32)
+            for start in range(0, size, SEMANTIC_CACHE_SCAN_BLOCK):
+                stop = min(start + SEMANTIC_CACHE_SCAN_BLOCK, size)
+                sims[start:stop] = self._vectors[start:stop].astype(np.float32) @ query
+            sims *= self._scales[:size]
+            candidates = np.flatnonzero((sims >= self.threshold) & (self._expires_at[:size] > time.monotonic()))
+            for row in candidates[np.argsort(-sims[candidates])]:
+                if self._keys[row] == key:
+                    self._clock += 1
+                    self._last_used[row] = self._clock
+                    return self._payloads[row]
+            return None
+    
+    def store(self, embedding: List[float], key: Any, payload: Any) -> None:
+        """Insert a query result, evicting the least recently used entry when full"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            vec = self._normalize(embedding)
+            if self._vectors is None or self._vectors.shape[1] != vec.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vec.shape[0]), dtype=np.int8)
+                self._scales = np.zeros(self.max_entries, dtype=np.float32)
+                self._expires_at = np.zeros(self.max_entries, dtype=np.float64)
+                self._keys.clear()
+                self._payloads.clear()
+            
+            if len(self._payloads) < self.max_entries:
+                row = len(self._payloads)
+                self._keys.append(key)
+                self._payloads.append(payload)
+            else:
+                # Reuse an expired entry first, otherwise the least recently used one
+                now = time.monotonic()
+                expired = np.flatnonzero(self._expires_at <= now)
+                if expired.size:
+                    row = int(expired[0])
+                else:
+                    row = min(range(self.max_entries), key=self._last_used.__getitem__)
+                self._keys[row] = key
+                self._payloads[row] = payload
+            
+            scale = float(np.abs(vec).max()) / 127.0 or 1.0
+            self._vectors[row] = np.round(vec / scale).astype(np.int8)
+            self._scales[row] = scale
+            self._expires_at[row] = time.monotonic() + self.ttl
+            self._clock += 1
+            self._last_used[row] = self._clock
+    
+    def clear(self) -> None:
+        """Drop every cached result (e.g. after the index was updated)"""
+        with self._lock:
+            self._vectors = None
+            self._scales = None
+            self._expires_at = None
+            self._keys.clear()
+            self._payloads.clear()
+            self._last_used = [0] * self.max_entries
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent callers into a single API call.
+    A background thread drains up to max_batch queued texts (waiting at most
+    `window` seconds for more to arrive) and hands each batch to a small pool,
+    which sends it and resolves each caller's Future.
+    """
+    
+    def __init__(self, send_batch: Callable[[List[str]], List[Tuple[float, ...]]],
+                 max_batch: int = EMBEDDING_BATCH_SIZE, window: float = EMBEDDING_BATCH_WINDOW,
+                 workers: int = EMBEDDING_BATCH_WORKERS):
+        self._send_batch = send_batch
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding-batch")
+        self._lock = threading.Lock()
+    
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding; the Future resolves to its vector or raises"""
+        future: Future = Future()
+        self._queue.put((text, future))
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+        return future
+    
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            self._executor.submit(self._dispatch, batch)
+    
+    def _dispatch(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            vectors = self._send_batch([text for text, _ in batch])
+            if len(vectors) != len(batch):
+                raise RuntimeError(f"expected {len(batch)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+@cache
+def _build_embedding_url(endpoint: str, deployment: str, api_version: str) -> str:
+    return f"{endpoint}openai/deployments/{deployment}/embeddings?api-version={api_version}"
+
+
+@cache
+def _build_search_url(search_service: str, index_name: str) -> str:
+    return f"https://{search_service}.search.windows.net/indexes/{index_name}/docs/search?api-version=2023-11-01"
 
 
 class AzureSearchVectorStore:
@@ -49,55 +264,84 @@ class AzureSearchVectorStore:
         self.azure_config = config["azure_openai"]
         
         # Azure AI Search configuration - use environment variables for production
-        self.search_service = os.getenv("AZURE_SEARCH_SERVICE", "insightgenius-search")
-        self.search_key = os.getenv("AZURE_SEARCH_KEY")
-        self.index_name = os.getenv("AZURE_SEARCH_INDEX", "alqueria-rag-index")
+        self.search_service = _SEARCH_SERVICE
+        self.search_key = _SEARCH_KEY
+        self.index_name = _INDEX_NAME
         
         # Update API key from environment variable for production
-        api_key = os.getenv("AZURE_OPENAI_API_KEY", self.azure_config["api_key"])
-        self.azure_config["api_key"] = api_key
+        if _OPENAI_API_KEY is not None:
+            self.azure_config["api_key"] = _OPENAI_API_KEY
         
         # Azure OpenAI for embeddings
-        self.embedding_url = f"{self.azure_config['endpoint']}openai/deployments/{self.azure_config['embedding_deployment']}/embeddings?api-version={self.azure_config['api_version']}"
+        self.embedding_url = _build_embedding_url(
+            self.azure_config["endpoint"],
+            self.azure_config["embedding_deployment"],
+            self.azure_config["api_version"]
+        )
         self.embedding_headers = {
             "Content-Type": "application/json",
             "api-key": self.azure_config["api_key"]
         }
         
         # Azure AI Search URLs
-        self.search_url = f"https://{self.search_service}.search.windows.net/indexes/{self.index_name}/docs/search?api-version=2023-11-01"
+        self.search_url = _build_search_url(self.search_service, self.index_name)
         self.search_headers = {
             "Content-Type": "application/json", 
             "api-key": self.search_key
         }
         
-        print(f"✅ Azure AI Search Vector Store initialized for Alpina")
-        print(f"   🔍 Search service: {self.search_service}")
-        print(f"   📚 Index: {self.index_name}")
-        print(f"   📊 Embedding model: {self.azure_config['embedding_deployment']}")
-        print(f"   📐 Dimensions: {self.azure_config['embedding_dimensions']}")
+        # Shared HTTP session - keep-alive connections avoid a TLS handshake per request
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=20,
+            pool_maxsize=50,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        self._session.mount("https://", adapter)
+        
+        # Query embeddings are deterministic per deployment - repeated queries skip the API call.
+        # Call self._cached_embedding.cache_clear() if the embedding deployment changes.
+        self._cached_embedding = lru_cache(maxsize=EMBEDDING_CACHE_SIZE)(self._request_embedding)
+        
+        # Cache misses from concurrent requests share one embeddings API call
+        self._embedding_batcher = EmbeddingBatcher(self._request_embeddings)
+        
+        # Paraphrased queries reuse the results of a near-identical previous query
+        self._semantic_cache = SemanticQueryCache()
+        
+        logger.info("✅ Azure AI Search Vector Store initialized for Alpina")
+        logger.info("   🔍 Search service: %s", self.search_service)
+        logger.info("   📚 Index: %s", self.index_name)
+        logger.info("   📊 Embedding model: %s", self.azure_config['embedding_deployment'])
+        logger.info("   📐 Dimensions: %s", self.azure_config['embedding_dimensions'])
     
     def generate_embedding(self, text: str) -> Optional[List[float]]:
-        """Generate embedding using Azure OpenAI"""
+        """Generate embedding using Azure OpenAI (cached per query text)"""
         try:
-            data = {"input": text}
-            response = requests.post(
-                self.embedding_url, 
-                headers=self.embedding_headers, 
-                json=data, 
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return response.json()["data"][0]["embedding"]
-            else:
-                print(f"❌ Error generating embedding: {response.status_code}")
-                return None
-                
+            return list(self._cached_embedding(text))
         except Exception as e:
-            print(f"❌ Error generating embedding: {e}")
+            logger.error("❌ Error generating embedding: %s", e)
             return None
     
+    def _request_embedding(self, text: str) -> Tuple[float, ...]:
+        """Embed one text through the batcher; raises on failure so errors are never cached"""
+        return self._embedding_batcher.submit(text).result(timeout=EMBEDDING_REQUEST_TIMEOUT)
+    
+    def _request_embeddings(self, texts: List[str]) -> List[Tuple[float, ...]]:
+        """Call Azure OpenAI once for a batch of texts, returning vectors in input order"""
+        response = self._session.post(
+            self.embedding_url, 
+            headers=self.embedding_headers, 
+            data=orjson.dumps({"input": texts}), 
+            timeout=EMBEDDING_REQUEST_TIMEOUT
+        )
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"status {response.status_code}")
+        
+        data = sorted(orjson.loads(response.content)["data"], key=lambda item: item["index"])
+        return [tuple(item["embedding"]) for item in data]
+    
     def similarity_search(self, 
                          query: str, 
                          k: int = 5, 
@@ -111,78 +355,95 @@ class AzureSearchVectorStore:
             # Generate embedding for query
             embedding = self.generate_embedding(query)
             if not embedding:
-                print("❌ Could not generate embedding for query")
-                return []
-            
-            # Build search request (hybrid like Vercel)
-            search_data = {
-                "search": query,
-                "vectorQueries": [{
-                    "vector": embedding, 
-                    "fields": "embedding", 
-                    "k": k, 
-                    "kind": "vector"
-                }],
-                "select": "id,content,title,client_name,document_id,study_type,year,month,brands,categories",
-                "top": k
-            }
-            
-            # DEBUG: Print search details
-            print(f"🔍 VECTOR STORE DEBUG:")
-            print(f"   Query: {query}")
-            print(f"   Embedding dimensions: {len(embedding) if embedding else 'None'}")
-            print(f"   Search URL: {self.search_url}")
-            print(f"   Search data: {json.dumps(search_data, indent=2)[:300]}...")
-            
-            # Execute search
-            response = requests.post(
-                self.search_url, 
-                headers=self.search_headers, 
-                json=search_data, 
-                timeout=30
-            )
-            
-            print(f"   Response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"❌ Search error: {response.status_code} - {response.text}")
+                logger.error("❌ Could not generate embedding for query")
                 return []
             
-            response_json = response.json()
-            results = response_json.get("value", [])
+            cache_key = (k, orjson.dumps(metadata_filter or {}, option=orjson.OPT_SORT_KEYS, default=str))
+            results = self._semantic_cache.lookup(embedding, cache_key)
             
-            print(f"   Raw results count: {len(results)}")
-            if results:
-                print(f"   First result: {results[0].get('id', 'N/A')[:50]}...")
+            if results is None:
+                results = self._execute_search(query, embedding, k)
+                if results is None:
+                    return []
+                if results:
+                    self._semantic_cache.store(embedding, cache_key, results)
             else:
-                print(f"   Full response: {json.dumps(response_json, indent=2)[:500]}...")
+                logger.debug("⚡ Semantic cache hit for query: %s", query)
             
-            # Convert to SearchDocument objects with similarity scores
+            # Threshold on the raw search score (Azure AI Search already returns appropriate
+            # scores), so SearchDocuments are only built for accepted results
             documents = []
-            for i, result in enumerate(results):
-                doc = SearchDocument.from_search_result(result)
-                # Use search score as similarity (Azure AI Search already returns appropriate scores)
-                similarity = doc.score  # Use raw score - Azure AI Search handles scoring correctly
-                
-                print(f"   Result {i+1}: score={doc.score}, similarity={similarity}, min_required={min_similarity}")
-                
-                if similarity >= min_similarity:
-                    documents.append((doc, similarity))
-                    print(f"     ✅ ACCEPTED - above threshold")
-                else:
-                    print(f"     ❌ REJECTED - below threshold")
+            for result in results:
+                if result.get("@search.score", 0.0) >= min_similarity:
+                    doc = SearchDocument.from_search_result(result)
+                    documents.append((doc, doc.score))
+            logger.debug("   %d results below min_similarity=%s rejected",
+                         len(results) - len(documents), min_similarity)
             
-            print(f"✅ Found {len(documents)} relevant documents (from {len(results)} total results)")
+            logger.info("✅ Found %d relevant documents (from %d total results)", len(documents), len(results))
             return documents
             
         except Exception as e:
-            print(f"❌ Error in similarity search: {e}")
+            logger.error("❌ Error in similarity search: %s", e)
             return []
     
+    def _execute_search(self, query: str, embedding: List[float], k: int) -> Optional[List[Dict[str, Any]]]:
+        """Run the hybrid query against Azure AI Search; returns raw results or None on error"""
+        # Build search request (hybrid like Vercel)
+        search_data = {
+            "search": query,
+            "vectorQueries": [{
+                "vector": embedding, 
+                "fields": "embedding", 
+                "k": k, 
+                "kind": "vector"
+            }],
+            "select": "id,content,title,client_name,document_id,study_type,year,month,brands,categories",
+            "top": k
+        }
+        payload = orjson.dumps(search_data)
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("🔍 VECTOR STORE DEBUG:")
+            logger.debug("   Query: %s", query)
+            logger.debug("   Embedding dimensions: %d", len(embedding))
+            logger.debug("   Search URL: %s", self.search_url)
+            logger.debug("   Search data: %s...", payload[:300].decode('utf-8', 'ignore'))
+        
+        # Execute search
+        response = self._session.post(
+            self.search_url, 
+            headers=self.search_headers, 
+            data=payload, 
+            timeout=30
+        )
+        
+        if response.status_code != 200:
+            logger.error("❌ Search error: %s - %s", response.status_code, response.text)
+            return None
+        
+        response_json = orjson.loads(response.content)
+        results = response_json.get("value", [])
+        
+        if debug:
+            logger.debug("   Raw results count: %d", len(results))
+            if results:
+                logger.debug("   First result: %s...", results[0].get('id', 'N/A')[:50])
+            else:
+                logger.debug("   Full response: %s...", response.content[:500].decode('utf-8', 'ignore'))
+        
+        return results
+    
+    def clear_caches(self) -> None:
+        """Forget cached search results, e.g. after the Azure AI Search index was rebuilt"""
+        self._semantic_cache.clear()
+        logger.info("🧹 Semantic search cache cleared")
+    
     def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
         """Add document (not implemented for read-only Azure Search)"""
-        print("⚠️ Adding documents not supported with Azure AI Search backend")
-        print("   Documents are managed through the Azure portal")
+        logger.warning("⚠️ Adding documents not supported with Azure AI Search backend")
+        logger.warning("   Documents are managed through the Azure portal")
         return "read-only-backend"
     
     def get_document_stats(self) -> Dict[str, Any]:
@@ -190,10 +451,10 @@ class AzureSearchVectorStore:
         try:
             # Get index statistics
             stats_url = f"https://{self.search_service}.search.windows.net/indexes/{self.index_name}/stats?api-version=2023-11-01"
-            response = requests.get(stats_url, headers=self.search_headers, timeout=10)
+            response = self._session.get(stats_url, headers=self.search_headers, timeout=10)
             
             if response.status_code == 200:
-                stats = response.json()
+                stats = orjson.loads(response.content)
                 return {
                     "total_documents": stats.get("documentCount", 0),
                     "storage_size_bytes": stats.get("storageSize", 0),
@@ -204,10 +465,10 @@ class AzureSearchVectorStore:
                     "last_updated": datetime.now().isoformat()
                 }
             else:
-                print(f"❌ Error getting stats: {response.status_code}")
+                logger.error("❌ Error getting stats: %s", response.status_code)
                 
         except Exception as e:
-            print(f"❌ Error getting document stats: {e}")
+            logger.error("❌ Error getting document stats: %s", e)
         
         return {
             "total_documents": "1500+",
@@ -219,10 +480,10 @@ class AzureSearchVectorStore:
     
     def save_to_file(self, filepath: str) -> bool:
         """Save not supported for Azure AI Search"""
-        print("⚠️ Save to file not supported with Azure AI Search backend")
+        logger.warning("⚠️ Save to file not supported with Azure AI Search backend")
         return False
     
     def load_from_file(self, filepath: str) -> bool:
         """Load not needed for Azure AI Search"""
-        print("✅ Using Azure AI Search - no local file loading needed")
+        logger.info("✅ Using Azure AI Search - no local file loading needed")
         return True
\ No newline at end of file
@@ -5,15 +5,177 @@ Uses Azure OpenAI for both embeddings and vector search
 """
 
 import os
+import re
 import uuid
 import json
-# import numpy as np  # Removed for Azure compatibility
+import time
+import struct
+import sqlite3
+import heapq
+import hashlib
+import threading
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
+import orjson
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 # from sklearn.metrics.pairwise import cosine_similarity  # Removed for Azure compatibility
-from core.math_utils import cosine_similarity  # Using pure Python implementation
+from core.math_utils import dot_product, normalize_vector  # Using pure Python implementation
+from core.azure_search_vector_store import SemanticQueryCache
+
+try:
+    import numpy as np
+except ImportError:  # Azure App Service deployments run without numpy
+    np = None
+
+try:
+    import simsimd
+except ImportError:  # Optional SIMD kernels; falls back to a NumPy matvec
+    simsimd = None
+
+try:
+    import hnswlib
+except ImportError:  # Optional ANN index for large stores; search stays exact without it
+    hnswlib = None
+
+try:
+    import ahocorasick
+except ImportError:  # Optional; study-type detection falls back to precompiled regexes
+    ahocorasick = None
+
+
+def _quantize_int8(vector: "np.ndarray") -> "np.ndarray":
+    """Scalar-quantize a vector to int8 (per-vector scale; cosine is scale-invariant)"""
+    peak = float(np.abs(vector).max())
+    scale = 127.0 / peak if peak > 0 else 1.0
+    return np.round(vector * scale).astype(np.int8)
+
+
+def _prefix_rows(matrix: "np.ndarray", dims: int) -> "np.ndarray":
+    """Leading dims of each row, renormalized to unit length (Matryoshka-style truncation)"""
+    prefix = np.array(matrix[..., :dims], dtype=np.float32)
+    norms = np.linalg.norm(prefix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return prefix / norms
+
+# Prefiltered searches rescore this many candidates per requested result at full dimension
+PREFILTER_OVERSAMPLE = 4
+
+# Persistence: metadata may carry non-str keys; embeddings may be numpy arrays
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Max (query, k, filter, min_similarity) results kept per store; invalidated on any write
+QUERY_CACHE_SIZE = 1024
+
+# With "processing.use_hnsw" (off by default), stores with at least this many chunks answer
+# unfiltered searches approximately from an HNSW graph (hnswlib); otherwise search is exact
+HNSW_MIN_DOCUMENTS = 5000
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Study types by document-name keyword (Tigo Honduras specific), in priority order:
+# the first type with any matching keyword wins
+_STUDY_TYPE_KEYWORDS = (
+    ("brand_health", ("brand health", "tracking", "salud marca")),
+    ("communication_test", ("communication", "comunicación", "advertising", "publicitario")),
+    ("concept_test", ("concept", "concepto", "evaluación concepto")),
+    ("pack_test", ("pack", "empaque", "packaging")),
+    ("usage_attitudes", ("usage", "uso", "attitudes", "actitudes")),
+    ("segmentation", ("segmentation", "segmentación")),
+    ("pricing", ("pricing", "precio", "price")),
+    ("product_test", ("product", "producto")),
+    ("maxdiff", ("maxdiff", "max diff")),
+    ("conjoint", ("conjoint", "trade-off")),
+)
+
+# One pass over the name for all keywords (Aho-Corasick), else one regex per study type
+if ahocorasick is not None:
+    _STUDY_TYPE_AUTOMATON = ahocorasick.Automaton()
+    for _priority, (_, _keywords) in enumerate(_STUDY_TYPE_KEYWORDS):
+        for _keyword in _keywords:
+            _STUDY_TYPE_AUTOMATON.add_word(_keyword, _priority)
+    _STUDY_TYPE_AUTOMATON.make_automaton()
+else:
+    _STUDY_TYPE_AUTOMATON = None
+_STUDY_TYPE_PATTERNS = tuple(
+    (study_type, re.compile("|".join(map(re.escape, keywords))))
+    for study_type, keywords in _STUDY_TYPE_KEYWORDS
+)
+
+# Max texts sent in one embeddings request (bulk ingestion); keeps requests well under the API token limit
+EMBEDDING_BATCH_SIZE = 256
+
+# Embedding requests in flight at once during bulk ingestion ("processing.embedding_workers")
+EMBEDDING_WORKERS = 4
+
+
+class _SearchFilter:
+    """
+    Metadata filter used as a search cache key: hashed by its JSON form, but equal only to
+    an equal filter, so e.g. a tuple and a list with the same JSON get separate entries.
+    The caller's filter itself is what reaches _rank.
+    """
+    
+    __slots__ = ("value", "key")
+    
+    def __init__(self, value: Optional[Dict[str, Any]]):
+        self.value = value
+        self.key = json.dumps(value or {}, sort_keys=True)  # TypeError: not cacheable
+    
+    def __hash__(self) -> int:
+        return hash(self.key)
+    
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, _SearchFilter) and self.key == other.key and self.value == other.value
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache (SQLite) keyed by sha256(model + text).
+    Survives restarts, so re-indexing unchanged content does not call Azure OpenAI again.
+    """
+    
+    def __init__(self, path: str, model: str, ttl_seconds: Optional[float] = None):
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, embedding_model TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def _key(self, text: str) -> str:
+        return hashlib.sha256((self.model + "|" + text).encode("utf-8")).hexdigest()
+    
+    def get(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ? AND embedding_model = ?",
+                (self._key(text), self.model)
+            ).fetchone()
+        if row is None:
+            return None
+        vector, created_at = row
+        if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+            return None
+        return list(struct.unpack(f"{len(vector) // 4}f", vector))
+    
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        now = time.time()
+        rows = [
+            (self._key(text), self.model, struct.pack(f"{len(embedding)}f", *embedding), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
 
 
 @dataclass
@@ -21,7 +183,7 @@ class DocumentChunk:
     """Document chunk with metadata"""
     id: str
     content: str
-    embedding: List[float]
+    embedding: List[float]  # or a float32 row view of a memory-mapped matrix (binary load)
     metadata: Dict[str, Any]
     created_at: str
     
@@ -45,9 +207,80 @@ class AzureOpenAIVectorStore:
         
         # Vector storage
         self.documents: Dict[str, DocumentChunk] = {}
-        self.embeddings_matrix: Optional[List[List[float]]] = None  # Changed from np.ndarray
         self.document_ids: List[str] = []
         
+        # Row bookkeeping: row i of the matrices belongs to document_ids[i]
+        self._id_to_row: Dict[str, int] = {}
+        
+        # Inverted indexes for metadata filters: key -> value -> doc ids (unhashable values listed apart)
+        self._metadata_index: Dict[str, Dict[Any, set]] = {}
+        self._unindexed_metadata: Dict[str, set] = {}
+        
+        # Columnar view of the same metadata for numpy filters: key -> int32 value code per row
+        # (-1 = absent or unhashable); codes come from _metadata_codes[key][value]
+        self._metadata_columns: Dict[str, "np.ndarray"] = {}
+        self._metadata_codes: Dict[str, Dict[Any, int]] = {}
+        self._metadata_capacity = 0
+        
+        # Contiguous embeddings for batched search; rows [0, _size) are in use.
+        # "processing.vector_precision": "i8" scores against an int8-quantized copy (simsimd only).
+        # This is a scoring-precision option, not a memory saving: chunk embeddings stay float for
+        # persistence and the HNSW index, so i8 adds the int8 matrix on top of them.
+        self.vector_precision = config.get("processing", {}).get("vector_precision", "f32")
+        if self.vector_precision == "i8" and simsimd is None:
+            print("⚠️ int8 vectors need simsimd; using float32")
+            self.vector_precision = "f32"
+        self._matrix: Optional["np.ndarray"] = None
+        self._size = 0
+        
+        # "processing.prefilter_dimensions": shortlist candidates on that many leading dimensions
+        # (models trained Matryoshka-style, e.g. text-embedding-3-*), then rescore at full dimension.
+        # 0 disables; float32 vectors only.
+        self.prefilter_dimensions = config.get("processing", {}).get("prefilter_dimensions", 0)
+        self._matrix_short: Optional["np.ndarray"] = None
+        
+        # Opt-in approximate index ("processing.use_hnsw"), built lazily once the store reaches
+        # "processing.hnsw_min_documents". Labels are stable per chunk (rows move on delete);
+        # deleted labels are only marked.
+        self.use_hnsw = config.get("processing", {}).get("use_hnsw", False)
+        if self.use_hnsw and hnswlib is None:
+            print("⚠️ use_hnsw needs hnswlib; searches stay exact")
+            self.use_hnsw = False
+        self.hnsw_min_documents = config.get("processing", {}).get("hnsw_min_documents", HNSW_MIN_DOCUMENTS)
+        self._hnsw = None
+        self._hnsw_labels: Dict[str, int] = {}
+        self._hnsw_ids: Dict[int, str] = {}
+        
+        # Repeated searches reuse their ranked doc ids; _generation is bumped on every write
+        self._generation = 0
+        self._cached_search = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._search_ids)
+        
+        # Paraphrased queries (near-identical embedding) reuse a previous ranking
+        self._semantic_cache = SemanticQueryCache()
+        
+        # Shared HTTP session - keep-alive connections avoid a TLS handshake per request.
+        # Embedding requests are idempotent, so throttling (429) and 5xx answers are retried.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset({"POST"}))
+        )
+        self._session.mount("https://", adapter)
+        self.embedding_workers = config.get("processing", {}).get("embedding_workers", EMBEDDING_WORKERS)
+        
+        # Persistent embedding cache ("processing.enable_caching" / "cache_ttl_hours" in the client config)
+        processing = config.get("processing", {})
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if processing.get("enable_caching"):
+            ttl_hours = processing.get("cache_ttl_hours")
+            self.embedding_cache = EmbeddingCache(
+                processing.get("embedding_cache_path", "embedding_cache.sqlite3"),
+                self.azure_config["embedding_model"],
+                ttl_seconds=ttl_hours * 3600 if ttl_hours else None
+            )
+        
         # Tigo Honduras specific metadata structure
         self.metadata_schema = {
             "client": "tigo_honduras",
@@ -67,72 +300,126 @@ class AzureOpenAIVectorStore:
         print(f"   📐 Dimensions: {self.azure_config['embedding_dimensions']}")
     
     def generate_embedding(self, text: str) -> Optional[List[float]]:
-        """Generate embedding using Azure OpenAI"""
+        """Generate embedding using Azure OpenAI (L2-normalized, so cosine similarity is a dot product)"""
+        embeddings = self.generate_embeddings([text])
+        return embeddings[0] if embeddings else None
+    
+    def generate_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Generate embeddings for many texts; only texts missing from the embedding cache hit the API"""
+        if self.embedding_cache is None:
+            return self._request_embeddings(texts)
+        
+        embeddings = [self.embedding_cache.get(text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fetched = self._request_embeddings([texts[i] for i in missing])
+            if fetched is None or len(fetched) != len(missing):
+                return None
+            self.embedding_cache.put_many([texts[i] for i in missing], fetched)
+            for i, embedding in zip(missing, fetched):
+                embeddings[i] = embedding
+        
+        return embeddings
+    
+    def _request_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Call Azure OpenAI, EMBEDDING_BATCH_SIZE texts per request"""
         try:
             headers = {
                 "Content-Type": "application/json",
                 "api-key": self.azure_config["api_key"]
             }
             
-            data = {"input": text}
-            
             url = f"{self.azure_config['endpoint']}/openai/deployments/{self.azure_config['embedding_deployment']}/embeddings?api-version={self.azure_config['api_version']}"
             
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
+            def request_batch(batch: List[str]) -> List[List[float]]:
+                response = self._session.post(url, headers=headers, json={"input": batch}, timeout=30)
+                response.raise_for_status()
+                
+                result = response.json()
+                return [normalize_vector(item["embedding"])
+                        for item in sorted(result["data"], key=lambda item: item["index"])]
+            
+            batches = [texts[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+            if len(batches) <= 1:
+                return request_batch(batches[0]) if batches else []
             
-            result = response.json()
-            return result["data"][0]["embedding"]
+            # Network-bound: threads overlap the round trips; map keeps batch order
+            embeddings = []
+            with ThreadPoolExecutor(max_workers=min(self.embedding_workers, len(batches))) as executor:
+                for batch_embeddings in executor.map(request_batch, batches):
+                    embeddings.extend(batch_embeddings)
+            
+            return embeddings
             
         except Exception as e:
-            print(f"❌ Error generating embedding: {e}")
+            print(f"❌ Error generating embeddings: {e}")
             return None
     
     def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
         """Add document chunk to vector store"""
+        return self.add_documents([content], [metadata])[0]
+    
+    def add_documents(self, contents: List[str], metadatas: List[Dict[str, Any]]) -> List[str]:
+        """Add many document chunks, embedding them in batched API calls"""
         try:
-            # Generate embedding
-            embedding = self.generate_embedding(content)
-            if not embedding:
+            if len(contents) != len(metadatas):
+                raise ValueError("contents and metadatas must have the same length")
+            if not contents:
+                return []
+            
+            # Generate embeddings; all of them must exist before the store is touched
+            embeddings = self.generate_embeddings(contents)
+            if (not embeddings or len(embeddings) != len(contents)
+                    or any(embedding is None for embedding in embeddings)):
                 raise ValueError("Failed to generate embedding")
             
-            # Validate and enrich metadata
-            enriched_metadata = self._enrich_metadata(metadata)
-            
-            # Create document chunk
-            chunk_id = str(uuid.uuid4())
-            chunk = DocumentChunk(
-                id=chunk_id,
-                content=content,
-                embedding=embedding,
-                metadata=enriched_metadata,
-                created_at=datetime.now().isoformat()
-            )
+            chunk_ids = []
             
-            # Store document
-            self.documents[chunk_id] = chunk
-            self.document_ids.append(chunk_id)
+            # One timestamp for the whole batch
+            now = datetime.now()
+            created_at = now.isoformat()
             
-            # Update embeddings matrix
-            self._update_embeddings_matrix()
+            for content, metadata, embedding in zip(contents, metadatas, embeddings):
+                # Validate and enrich metadata
+                enriched_metadata = self._enrich_metadata(metadata, now)
+                
+                # Create document chunk
+                chunk_id = str(uuid.uuid4())
+                chunk = DocumentChunk(
+                    id=chunk_id,
+                    content=content,
+                    embedding=embedding,
+                    metadata=enriched_metadata,
+                    created_at=created_at
+                )
+                
+                # Store document
+                self.documents[chunk_id] = chunk
+                self.document_ids.append(chunk_id)
+                self._append_row(chunk)
+                self._index_chunk(chunk)
+                chunk_ids.append(chunk_id)
             
-            print(f"✅ Added document chunk: {chunk_id}")
-            print(f"   📄 Content length: {len(content)} chars")
-            print(f"   📊 Study type: {enriched_metadata.get('study_type', 'Unknown')}")
+            self._invalidate_searches()
             
-            return chunk_id
+            print(f"✅ Added {len(chunk_ids)} document chunk(s), {sum(map(len, contents))} chars")
+            
+            return chunk_ids
             
         except Exception as e:
             print(f"❌ Error adding document: {e}")
             raise
     
-    def _enrich_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
-        """Enrich metadata with Tigo Honduras specific information"""
+    def _enrich_metadata(self, metadata: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Enrich metadata with Tigo Honduras specific information (now: batch timestamp, defaults to the current time)"""
+        if now is None:
+            now = datetime.now()
+        
         enriched = {
             "client": "tigo_honduras",
             "industry": "telecom",
             "language": "spanish_honduras",
-            "processing_date": datetime.now().isoformat()
+            "processing_date": now.isoformat()
         }
         
         # Merge provided metadata
@@ -143,7 +430,7 @@ class AzureOpenAIVectorStore:
             enriched["study_type"] = self._detect_study_type(metadata.get("document_name", ""))
         
         if "year" not in enriched:
-            enriched["year"] = datetime.now().year
+            enriched["year"] = now.year
         
         if "confidence_score" not in enriched:
             enriched["confidence_score"] = 1.0
@@ -154,33 +441,140 @@ class AzureOpenAIVectorStore:
         """Detect study type from document name (Tigo Honduras specific)"""
         document_lower = document_name.lower()
         
-        study_types = {
-            "brand_health": ["brand health", "tracking", "salud marca"],
-            "communication_test": ["communication", "comunicación", "advertising", "publicitario"],
-            "concept_test": ["concept", "concepto", "evaluación concepto"],
-            "pack_test": ["pack", "empaque", "packaging"],
-            "usage_attitudes": ["usage", "uso", "attitudes", "actitudes"],
-            "segmentation": ["segmentation", "segmentación"],
-            "pricing": ["pricing", "precio", "price"],
-            "product_test": ["product", "producto"],
-            "maxdiff": ["maxdiff", "max diff"],
-            "conjoint": ["conjoint", "trade-off"]
-        }
-        
-        for study_type, keywords in study_types.items():
-            if any(keyword in document_lower for keyword in keywords):
-                return study_type
+        if _STUDY_TYPE_AUTOMATON is not None:
+            priority = min((p for _, p in _STUDY_TYPE_AUTOMATON.iter(document_lower)), default=None)
+            if priority is not None:
+                return _STUDY_TYPE_KEYWORDS[priority][0]
+        else:
+            for study_type, pattern in _STUDY_TYPE_PATTERNS:
+                if pattern.search(document_lower):
+                    return study_type
         
         return "general_research"
     
-    def _update_embeddings_matrix(self):
-        """Update the embeddings matrix for efficient similarity search"""
-        if not self.documents:
-            self.embeddings_matrix = None
+    def _append_row(self, chunk: DocumentChunk):
+        """Register a new chunk's row and copy its embedding into the contiguous matrix"""
+        row = len(self._id_to_row)
+        self._id_to_row[chunk.id] = row
+        if np is None:
             return
         
-        embeddings = [doc.embedding for doc in self.documents.values()]
-        self.embeddings_matrix = embeddings  # Already a list of lists
+        self._set_metadata_row(chunk, row)
+        vector = np.asarray(chunk.embedding, dtype=np.float32)
+        if self.vector_precision == "i8":
+            vector = _quantize_int8(vector)
+        if self._matrix is None or row == self._matrix.shape[0]:
+            # Geometric growth keeps appends amortized O(D)
+            matrix = np.zeros((max(16, 2 * row), vector.shape[0]), dtype=vector.dtype)
+            if self._matrix is not None:
+                matrix[:row] = self._matrix[:row]
+            self._matrix = matrix
+            
+            dims = self._prefilter_dims(vector.shape[0])
+            if dims:
+                short = np.zeros((matrix.shape[0], dims), dtype=np.float32)
+                if self._matrix_short is not None:
+                    short[:row] = self._matrix_short[:row]
+                self._matrix_short = short
+        
+        self._matrix[row] = vector
+        if self._matrix_short is not None:
+            self._matrix_short[row] = _prefix_rows(vector, self._matrix_short.shape[1])
+        self._size = row + 1
+        
+        if self._hnsw is not None:
+            self._hnsw_add([chunk.id])
+    
+    def _remove_row(self, doc_id: str):
+        """Swap-remove: the last row moves into the deleted row's slot, O(D) instead of a rebuild"""
+        row = self._id_to_row.pop(doc_id)
+        if doc_id in self._hnsw_labels:
+            label = self._hnsw_labels.pop(doc_id)
+            del self._hnsw_ids[label]
+            self._hnsw.mark_deleted(label)
+        last = len(self.document_ids) - 1
+        if row != last:
+            moved_id = self.document_ids[last]
+            self.document_ids[row] = moved_id
+            self._id_to_row[moved_id] = row
+            if self._matrix is not None:
+                self._matrix[row] = self._matrix[last]
+                # A row view of the matrix (binary load) must follow its row: the last slot is reused
+                moved = self.documents[moved_id]
+                if isinstance(moved.embedding, np.ndarray) and np.shares_memory(moved.embedding, self._matrix):
+                    moved.embedding = self._matrix[row]
+            if self._matrix_short is not None:
+                self._matrix_short[row] = self._matrix_short[last]
+            for column in self._metadata_columns.values():
+                column[row] = column[last]
+        
+        self.document_ids.pop()
+        if self._matrix is not None:
+            self._size = last
+    
+    def _rebuild_matrix(self, matrix: Optional["np.ndarray"] = None):
+        """
+        Rebuild row bookkeeping, metadata indexes and the contiguous matrix from self.document_ids (load).
+        A float32 matrix already in row order (memory-mapped embeddings.npy) is adopted as is.
+        """
+        self._reset_matrix()
+        adopt = matrix is not None and self.vector_precision == "f32"
+        for doc_id in self.document_ids:
+            if adopt:
+                self._id_to_row[doc_id] = len(self._id_to_row)
+                self._set_metadata_row(self.documents[doc_id], self._id_to_row[doc_id])
+            else:
+                self._append_row(self.documents[doc_id])
+            self._index_chunk(self.documents[doc_id])
+        
+        if adopt:
+            self._matrix = matrix
+            self._size = matrix.shape[0]
+            dims = self._prefilter_dims(matrix.shape[1])
+            if dims:
+                self._matrix_short = _prefix_rows(matrix, dims)
+    
+    def _prefilter_dims(self, dimensions: int) -> int:
+        if self.vector_precision == "f32" and 0 < self.prefilter_dimensions < dimensions:
+            return self.prefilter_dimensions
+        return 0
+    
+    def _reset_matrix(self):
+        self._matrix = None
+        self._matrix_short = None
+        self._size = 0
+        self._hnsw = None
+        self._hnsw_labels = {}
+        self._hnsw_ids = {}
+        self._id_to_row = {}
+        self._metadata_index = {}
+        self._unindexed_metadata = {}
+        self._metadata_columns = {}
+        self._metadata_codes = {}
+        self._metadata_capacity = 0
+    
+    def _set_metadata_row(self, chunk: DocumentChunk, row: int):
+        """Write a chunk's metadata value codes into row `row` of the columnar view"""
+        if row >= self._metadata_capacity:
+            # Geometric growth, like the embeddings matrix
+            capacity = max(16, 2 * row)
+            for key, column in self._metadata_columns.items():
+                grown = np.full(capacity, -1, dtype=np.int32)
+                grown[:row] = column[:row]
+                self._metadata_columns[key] = grown
+            self._metadata_capacity = capacity
+        
+        for column in self._metadata_columns.values():
+            column[row] = -1
+        for key, value in chunk.metadata.items():
+            codes = self._metadata_codes.setdefault(key, {})
+            try:
+                code = codes.setdefault(value, len(codes))
+            except TypeError:
+                continue  # Unhashable: matched through self._unindexed_metadata
+            if key not in self._metadata_columns:
+                self._metadata_columns[key] = np.full(self._metadata_capacity, -1, dtype=np.int32)
+            self._metadata_columns[key][row] = code
     
     def similarity_search(self, 
                          query: str, 
@@ -191,77 +585,275 @@ class AzureOpenAIVectorStore:
         Perform similarity search with metadata filtering
         """
         try:
-            # Generate query embedding
-            query_embedding = self.generate_embedding(query)
-            if not query_embedding:
-                return []
+            try:
+                search_filter = _SearchFilter(metadata_filter or None)
+            except TypeError:
+                # Not JSON-serializable, so not cacheable
+                return self._search(query, k, metadata_filter, min_similarity)
             
-            # Filter documents by metadata
-            filtered_docs = self._filter_by_metadata(metadata_filter) if metadata_filter else self.documents
+            hits = self._cached_search(query, k, search_filter, min_similarity, self._generation)
+            return [(self.documents[doc_id], score) for doc_id, score in hits]
+            
+        except Exception as e:
+            print(f"❌ Error in similarity search: {e}")
+            return []
+    
+    def _invalidate_searches(self):
+        """Called after every write: cached rankings no longer reflect the store"""
+        self._generation += 1
+        self._cached_search.cache_clear()
+        self._semantic_cache.clear()
+    
+    def _search_ids(self, query: str, k: int, search_filter: _SearchFilter, min_similarity: float,
+                    generation: int) -> Tuple[Tuple[str, float], ...]:
+        """Cacheable search: (doc_id, score) pairs; `generation` only keys the caches"""
+        query_embedding = self._embed_query(query)
+        
+        cache_key = (k, search_filter, min_similarity, generation)
+        hits = self._semantic_cache.lookup(query_embedding, cache_key)
+        if hits is None:
+            results = self._rank(query_embedding, k, search_filter.value, min_similarity)
+            hits = tuple((doc.id, score) for doc, score in results)
+            self._semantic_cache.store(query_embedding, cache_key, hits)
+        return hits
+    
+    def _search(self,
+                query: str,
+                k: int,
+                metadata_filter: Optional[Dict[str, Any]],
+                min_similarity: float) -> List[Tuple[DocumentChunk, float]]:
+        """Uncached search"""
+        return self._rank(self._embed_query(query), k, metadata_filter, min_similarity)
+    
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a search query; raises so failures are never cached"""
+        query_embedding = self.generate_embedding(query)
+        if not query_embedding:
+            raise ValueError("Failed to generate query embedding")
+        return query_embedding
+    
+    def _rank(self,
+              query_embedding: List[float],
+              k: int,
+              metadata_filter: Optional[Dict[str, Any]],
+              min_similarity: float) -> List[Tuple[DocumentChunk, float]]:
+        """Rank the (filtered) documents against a normalized query embedding"""
+        if self._matrix is not None:
+            # Filter rows by metadata with vectorized masks
+            mask = self._filter_mask(metadata_filter) if metadata_filter else None
             
-            if not filtered_docs:
+            if not self.documents or (mask is not None and not mask.any()):
                 print("⚠️ No documents match metadata filter")
                 return []
             
-            # Calculate similarities using pure Python
-            results = []
-            
-            for doc_id, doc in filtered_docs.items():
-                # Using pure Python cosine similarity
-                similarity = cosine_similarity(query_embedding, doc.embedding)
-                
-                if similarity >= min_similarity:
-                    results.append((doc, float(similarity)))
+            if mask is None and self._hnsw_ready():
+                try:
+                    return self._hnsw_search(query_embedding, k, min_similarity)
+                except RuntimeError:
+                    pass  # hnswlib could not return k live neighbours: exact search below
             
-            # Sort by similarity and return top k
-            results.sort(key=lambda x: x[1], reverse=True)
-            return results[:k]
+            return self._batched_search(query_embedding, mask, k, min_similarity)
+        
+        # Filter documents by metadata
+        filtered_docs = self._filter_by_metadata(metadata_filter) if metadata_filter else self.documents
+        
+        if not filtered_docs:
+            print("⚠️ No documents match metadata filter")
+            return []
+        
+        # Calculate similarities using pure Python
+        results = []
+        
+        for doc_id, doc in filtered_docs.items():
+            # Embeddings are stored normalized: cosine similarity is just the dot product
+            similarity = dot_product(query_embedding, doc.embedding)
             
-        except Exception as e:
-            print(f"❌ Error in similarity search: {e}")
+            if similarity >= min_similarity:
+                results.append((doc, float(similarity)))
+        
+        # Top k by similarity without sorting every match
+        return heapq.nlargest(k, results, key=lambda x: x[1])
+    
+    def _batched_search(self,
+                        query_embedding: List[float],
+                        mask: Optional["np.ndarray"],
+                        k: int,
+                        min_similarity: float) -> List[Tuple[DocumentChunk, float]]:
+        """Score every stored embedding in one batched call (simsimd, else a float32 BLAS matvec) and select the top k"""
+        size = self._size
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        
+        if self.vector_precision == "i8":
+            # Quantized vectors are no longer unit length: use the cosine kernel on int8
+            sims = 1.0 - np.asarray(simsimd.cdist(_quantize_int8(query), self._matrix[:size], metric="cosine")).ravel()
+        elif self._matrix_short is not None and 0 < PREFILTER_OVERSAMPLE * k < size:
+            # Shortlist on the truncated embeddings, rescore only the shortlist at full dimension
+            short_sims = self._matrix_short[:size] @ _prefix_rows(query[0], self._matrix_short.shape[1])
+            if mask is not None:
+                short_sims[~mask] = -np.inf
+            shortlist = np.argpartition(-short_sims, PREFILTER_OVERSAMPLE * k - 1)[:PREFILTER_OVERSAMPLE * k]
+            sims = np.full(size, -np.inf, dtype=np.float32)
+            sims[shortlist] = self._matrix[shortlist] @ query[0]
+        elif simsimd is not None:
+            sims = np.asarray(simsimd.cdist(query, self._matrix[:size], metric="dot")).ravel()
+        else:
+            sims = self._matrix[:size] @ query[0]
+        
+        if mask is not None:
+            sims[~mask] = -np.inf
+        sims[~(sims >= min_similarity)] = -np.inf
+        
+        # O(N + k log k): partition out the k best rows, then sort only those
+        top = np.argpartition(-sims, k - 1)[:k] if 0 < k < size else np.arange(size)
+        top = top[np.argsort(-sims[top], kind="stable")]
+        
+        return [(self.documents[self.document_ids[i]], float(sims[i])) for i in top[:k] if sims[i] != -np.inf]
+    
+    def _hnsw_ready(self) -> bool:
+        """Build the HNSW index on first use once the store is large enough"""
+        if self._hnsw is None:
+            if not self.use_hnsw or self._matrix is None or self._size < self.hnsw_min_documents:
+                return False
+            self._hnsw = hnswlib.Index(space="cosine", dim=len(self.documents[self.document_ids[0]].embedding))
+            self._hnsw.init_index(max_elements=2 * self._size, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            self._hnsw_add(self.document_ids)
+        return True
+    
+    def _hnsw_add(self, doc_ids: List[str]):
+        # Float embeddings are indexed even when the matrix is int8
+        vectors = np.asarray([self.documents[doc_id].embedding for doc_id in doc_ids], dtype=np.float32)
+        needed = self._hnsw.element_count + len(doc_ids)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(2 * needed)
+        
+        labels = np.arange(self._hnsw.element_count, needed)
+        for doc_id, label in zip(doc_ids, labels.tolist()):
+            self._hnsw_labels[doc_id] = label
+            self._hnsw_ids[label] = doc_id
+        self._hnsw.add_items(vectors, labels)
+    
+    def _hnsw_search(self,
+                     query_embedding: List[float],
+                     k: int,
+                     min_similarity: float) -> List[Tuple[DocumentChunk, float]]:
+        """Approximate top k from the HNSW graph (unfiltered searches only)"""
+        k = min(k, len(self._hnsw_ids))
+        if k <= 0:
             return []
+        self._hnsw.set_ef(max(HNSW_EF_SEARCH, k))
+        labels, distances = self._hnsw.knn_query(np.asarray(query_embedding, dtype=np.float32), k=k)
+        
+        results = []
+        for label, distance in zip(labels[0].tolist(), distances[0].tolist()):
+            similarity = 1.0 - distance
+            if similarity >= min_similarity:
+                results.append((self.documents[self._hnsw_ids[label]], similarity))
+        return results
     
     def _filter_by_metadata(self, metadata_filter: Dict[str, Any]) -> Dict[str, DocumentChunk]:
-        """Filter documents by metadata criteria"""
-        filtered = {}
+        """Filter documents by metadata criteria using the per-key inverted indexes"""
+        candidates = None
+        
+        for key, value in metadata_filter.items():
+            matching = self._matching_ids(key, value)
+            candidates = matching if candidates is None else candidates & matching
+            if not candidates:
+                return {}
         
-        for doc_id, doc in self.documents.items():
-            match = True
+        return {doc_id: self.documents[doc_id] for doc_id in candidates}
+    
+    def _filter_mask(self, metadata_filter: Dict[str, Any]) -> "np.ndarray":
+        """Row mask for metadata criteria: each criterion is tested once per distinct value, then np.isin over the codes"""
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        
+        for key, value in metadata_filter.items():
+            index = self._metadata_index.get(key, {})
+            codes = self._metadata_codes.get(key, {})
             
-            for key, value in metadata_filter.items():
-                if key not in doc.metadata:
-                    match = False
-                    break
-                
-                doc_value = doc.metadata[key]
-                
-                # Handle different comparison types
-                if isinstance(value, dict):
-                    # Range queries: {"year": {"gte": 2020, "lte": 2024}}
-                    if "gte" in value and doc_value < value["gte"]:
-                        match = False
-                        break
-                    if "lte" in value and doc_value > value["lte"]:
-                        match = False
-                        break
-                    if "in" in value and doc_value not in value["in"]:
-                        match = False
-                        break
-                elif isinstance(value, list):
-                    # Multiple values: {"study_type": ["brand_health", "communication_test"]}
-                    if doc_value not in value:
-                        match = False
-                        break
-                else:
-                    # Exact match
-                    if doc_value != value:
-                        match = False
-                        break
-            
-            if match:
-                filtered[doc_id] = doc
-        
-        return filtered
+            if not isinstance(value, (dict, list)):
+                try:
+                    matching = [codes[value]] if value in index else []
+                except TypeError:
+                    matching = []
+            else:
+                matching = [codes[doc_value] for doc_value in index if self._metadata_matches(doc_value, value)]
+            
+            column = self._metadata_columns.get(key)
+            key_mask = np.isin(column[:size], matching) if column is not None else np.zeros(size, dtype=bool)
+            
+            # Unhashable values (lists, dicts) have no code and are checked one by one
+            for doc_id in self._unindexed_metadata.get(key, ()):
+                if self._metadata_matches(self.documents[doc_id].metadata[key], value):
+                    key_mask[self._id_to_row[doc_id]] = True
+            
+            mask &= key_mask
+        
+        return mask
+    
+    def _matching_ids(self, key: str, value: Any) -> set:
+        """Ids of documents whose metadata[key] satisfies one filter criterion"""
+        index = self._metadata_index.get(key, {})
+        
+        if not isinstance(value, (dict, list)):
+            try:
+                # Exact match: a single hash lookup
+                matching = set(index.get(value, ()))
+            except TypeError:
+                matching = set()
+        else:
+            # Range / multi-value: test each distinct value once instead of each document
+            matching = set()
+            for doc_value, doc_ids in index.items():
+                if self._metadata_matches(doc_value, value):
+                    matching |= doc_ids
+        
+        # Unhashable values (lists, dicts) are not indexed and are checked one by one
+        for doc_id in self._unindexed_metadata.get(key, ()):
+            if self._metadata_matches(self.documents[doc_id].metadata[key], value):
+                matching.add(doc_id)
+        
+        return matching
+    
+    @staticmethod
+    def _metadata_matches(doc_value: Any, value: Any) -> bool:
+        """Whether a document's metadata value satisfies one filter criterion"""
+        # Handle different comparison types
+        if isinstance(value, dict):
+            # Range queries: {"year": {"gte": 2020, "lte": 2024}}
+            if "gte" in value and doc_value < value["gte"]:
+                return False
+            if "lte" in value and doc_value > value["lte"]:
+                return False
+            if "in" in value and doc_value not in value["in"]:
+                return False
+            return True
+        elif isinstance(value, list):
+            # Multiple values: {"study_type": ["brand_health", "communication_test"]}
+            return doc_value in value
+        else:
+            # Exact match
+            return doc_value == value
+    
+    def _index_chunk(self, chunk: DocumentChunk):
+        """Add a chunk's metadata to the inverted indexes"""
+        for key, value in chunk.metadata.items():
+            try:
+                self._metadata_index.setdefault(key, {}).setdefault(value, set()).add(chunk.id)
+            except TypeError:
+                self._unindexed_metadata.setdefault(key, set()).add(chunk.id)
+    
+    def _unindex_chunk(self, chunk: DocumentChunk):
+        """Remove a chunk's metadata from the inverted indexes"""
+        for key, value in chunk.metadata.items():
+            try:
+                doc_ids = self._metadata_index[key][value]
+            except TypeError:
+                self._unindexed_metadata[key].discard(chunk.id)
+                continue
+            doc_ids.discard(chunk.id)
+            if not doc_ids:
+                del self._metadata_index[key][value]
     
     def get_document_stats(self) -> Dict[str, Any]:
         """Get statistics about stored documents"""
@@ -297,10 +889,9 @@ class AzureOpenAIVectorStore:
         """Delete document from vector store"""
         try:
             if doc_id in self.documents:
-                del self.documents[doc_id]
-                if doc_id in self.document_ids:
-                    self.document_ids.remove(doc_id)
-                self._update_embeddings_matrix()
+                self._unindex_chunk(self.documents.pop(doc_id))
+                self._remove_row(doc_id)
+                self._invalidate_searches()
                 print(f"✅ Deleted document: {doc_id}")
                 return True
             return False
@@ -313,7 +904,8 @@ class AzureOpenAIVectorStore:
         try:
             self.documents.clear()
             self.document_ids.clear()
-            self.embeddings_matrix = None
+            self._reset_matrix()
+            self._invalidate_searches()
             print("✅ Cleared all documents from vector store")
             return True
         except Exception as e:
@@ -321,19 +913,28 @@ class AzureOpenAIVectorStore:
             return False
     
     def save_to_file(self, filepath: str) -> bool:
-        """Save vector store to file"""
+        """
+        Save vector store to disk.
+        
+        With numpy available (and a path not ending in .json) the store is written as a
+        directory: embeddings.npy (float32, one row per chunk), docs.jsonl (content and
+        metadata, same row order) and metadata.json. Otherwise a single JSON file.
+        """
         try:
-            data = {
-                "documents": {doc_id: doc.to_dict() for doc_id, doc in self.documents.items()},
-                "metadata": {
-                    "created_at": datetime.now().isoformat(),
-                    "total_documents": len(self.documents),
-                    "client": "tigo_honduras"
-                }
+            metadata = {
+                "created_at": datetime.now().isoformat(),
+                "total_documents": len(self.documents),
+                "client": "tigo_honduras",
+                "normalized": True
             }
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            if np is None or filepath.endswith(".json"):
+                # orjson serializes the DocumentChunk dataclasses directly (no asdict copy)
+                data = {"documents": self.documents, "metadata": metadata}
+                with open(filepath, 'wb') as f:
+                    f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | _ORJSON_OPTIONS))
+            else:
+                self._save_binary(filepath, metadata)
             
             print(f"✅ Vector store saved to: {filepath}")
             return True
@@ -342,22 +943,56 @@ class AzureOpenAIVectorStore:
             print(f"❌ Error saving vector store: {e}")
             return False
     
+    def _save_binary(self, dirpath: str, metadata: Dict[str, Any]):
+        os.makedirs(dirpath, exist_ok=True)
+        
+        if self._matrix is not None and self._matrix.dtype == np.float32:
+            embeddings = self._matrix[:self._size]
+        else:
+            embeddings = np.asarray([self.documents[doc_id].embedding for doc_id in self.document_ids], dtype=np.float32)
+        
+        # Write-then-rename: a running process may have the previous file memory-mapped
+        tmp_path = os.path.join(dirpath, "embeddings.tmp.npy")
+        np.save(tmp_path, embeddings)
+        os.replace(tmp_path, os.path.join(dirpath, "embeddings.npy"))
+        
+        with open(os.path.join(dirpath, "docs.jsonl"), 'wb') as f:
+            for doc_id in self.document_ids:
+                chunk = self.documents[doc_id]
+                record = {"id": chunk.id, "content": chunk.content, "metadata": chunk.metadata,
+                          "created_at": chunk.created_at}
+                f.write(orjson.dumps(record, option=_ORJSON_OPTIONS) + b"\n")
+        
+        with open(os.path.join(dirpath, "metadata.json"), 'wb') as f:
+            f.write(orjson.dumps(dict(metadata, format="npy"), option=orjson.OPT_INDENT_2))
+    
     def load_from_file(self, filepath: str) -> bool:
-        """Load vector store from file"""
+        """Load vector store from a directory written by save_to_file, or a JSON file"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
             # Load documents
             self.documents.clear()
             self.document_ids.clear()
             
-            for doc_id, doc_data in data["documents"].items():
-                self.documents[doc_id] = DocumentChunk.from_dict(doc_data)
-                self.document_ids.append(doc_id)
+            if os.path.isdir(filepath):
+                matrix = self._load_binary(filepath)
+            else:
+                matrix = None
+                with open(filepath, 'rb') as f:
+                    data = orjson.loads(f.read())
+                
+                # Stores saved before embeddings were normalized are normalized on load
+                normalized = data.get("metadata", {}).get("normalized", False)
+                
+                for doc_id, doc_data in data["documents"].items():
+                    chunk = DocumentChunk.from_dict(doc_data)
+                    if not normalized:
+                        chunk.embedding = normalize_vector(chunk.embedding)
+                    self.documents[doc_id] = chunk
+                    self.document_ids.append(doc_id)
             
-            # Update embeddings matrix
-            self._update_embeddings_matrix()
+            # Rebuild the contiguous matrix and indexes in document_ids order
+            self._rebuild_matrix(matrix)
+            self._invalidate_searches()
             
             print(f"✅ Vector store loaded from: {filepath}")
             print(f"   📄 Documents loaded: {len(self.documents)}")
@@ -365,4 +1000,26 @@ class AzureOpenAIVectorStore:
             
         except Exception as e:
             print(f"❌ Error loading vector store: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def _load_binary(self, dirpath: str) -> Optional["np.ndarray"]:
+        """Read docs.jsonl and memory-map embeddings.npy; returns the matrix (None when empty)"""
+        with open(os.path.join(dirpath, "docs.jsonl"), 'rb') as f:
+            records = [orjson.loads(line) for line in f if line.strip()]
+        if not records:
+            return None
+        
+        # Copy-on-write mapping: pages stay shared between workers until a row is overwritten
+        matrix = np.load(os.path.join(dirpath, "embeddings.npy"), mmap_mode="c")
+        if matrix.shape[0] != len(records):
+            raise ValueError(f"embeddings.npy has {matrix.shape[0]} rows for {len(records)} documents")
+        
+        # Plain ndarray view of the mapping: orjson serializes ndarray but not the np.memmap subclass
+        matrix = matrix.view(np.ndarray)
+        
+        # Each chunk's embedding is a view of its row, not a Python list copy of it
+        for row, record in enumerate(records):
+            chunk = DocumentChunk(embedding=matrix[row], **record)
+            self.documents[chunk.id] = chunk
+            self.document_ids.append(chunk.id)
+        return matrix
\ No newline at end of file
@@ -9,7 +9,199 @@ import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import io
+import math
+import re
+import csv
 import base64
+import threading
+from html import escape
+import orjson
+
+try:
+    import pybase64
+except ImportError:  # Opcional: codificador SIMD; sin él se usa base64 de la librería estándar
+    pybase64 = None
+
+try:
+    import re2
+except ImportError:  # Opcional: motor de regex lineal (google-re2); sin él se usa re
+    re2 = None
+
+# Textos del LLM que empiecen con "=" o contengan URLs se escriben tal cual, sin fórmulas ni hipervínculos
+_XLSX_ENGINE_KWARGS = {"options": {"strings_to_formulas": False, "strings_to_urls": False}}
+
+# Mismo formato que json.dumps(indent=2, ensure_ascii=False); las claves no-str se convierten a texto
+_ORJSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# Patrones de _extract_numerical_data, compilados una sola vez.
+# Con RE2 el tiempo es lineal: en re, una frase larga sin punto ni "%" retrocede de forma
+# cúbica (~8 s para 1000 caracteres). \w, \d y \s se escriben explícitos porque en RE2 son
+# solo ASCII; así los resultados coinciden con re (Unicode).
+if re2 is not None:
+    _W, _D, _S = r'[\p{L}\p{N}_]', r'\p{Nd}', r'[\t\n\v\f\r\x{1c}-\x{1f} \x{85}\p{Z}]'
+    _PERCENTAGE_RE = re2.compile(rf'({_W}+[^.]*?)({_D}+%)')
+    _AGE_RE = re2.compile(rf'({_D}+){_S}*a{_S}*({_D}+){_S}*años.*?({_D}+%)')
+    _CITY_RE = re2.compile(rf'(?i)(Tegucigalpa|San Pedro Sula|Choloma|Comayagua|La Ceiba)[^.]*?({_D}+%)')
+else:
+    _PERCENTAGE_RE = re.compile(r'(\w+[^.]*?)(\d+%)')
+    _AGE_RE = re.compile(r'(\d+)\s*a\s*(\d+)\s*años.*?(\d+%)')
+    _CITY_RE = re.compile(r'(Tegucigalpa|San Pedro Sula|Choloma|Comayagua|La Ceiba)[^.]*?(\d+%)', re.IGNORECASE)
+_DEMOGRAPHIC_RE = re.compile(r'edad|años|género|hombres|mujeres')
+# Los tres patrones terminan en (\d+%): sin un dígito seguido de "%" no hay nada que extraer
+_DIGIT_PERCENT_RE = re.compile(r'\d%')
+
+# Buffers de Excel mayores a esto no se conservan para la siguiente exportación (bytes)
+EXCEL_BUFFER_MAX_RETAINED = 8 * 1024 * 1024
+
+# Mismo estilo de encabezado que aplica pandas en to_excel
+_XLSX_HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+
+def _b64encode_str(data) -> str:
+    """Base64 de un objeto bytes-like directamente como str"""
+    if pybase64 is not None:
+        # Produce el str en C, sin el bytes intermedio ni el .decode()
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
+
+
+# Columnas del CSV: filas de documentos, luego las que solo tienen los datos extraídos
+_CSV_DOCUMENT_COLUMNS = ("tipo", "nombre", "año", "similaridad", "relevancia", "categoria")
+_CSV_EXTRACTED_ONLY_COLUMNS = ("valor", "tipo_dato")
+_CSV_EXTRACTED_COLUMNS = ("tipo", "nombre", "valor", "categoria", "tipo_dato")
+
+
+def _csv_numeric_column(values: List[Any], has_gaps: bool) -> List[Any]:
+    """
+    Replica la inferencia de pandas para una columna numérica: si todos los valores
+    son números y hay celdas vacías o algún float, los enteros se escriben como float.
+    """
+    if values and (has_gaps or any(isinstance(v, float) for v in values)) and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+    ):
+        return [float(v) for v in values]
+    return values
+
+
+# Encabezado y CSS del reporte HTML: constante, se escribe tal cual en cada exportación
+_HTML_HEAD = """
+<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Reporte RAG - Tigo Honduras</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .header { background: linear-gradient(135deg, #1E40AF, #3B82F6); color: white; padding: 20px; border-radius: 10px; margin-bottom: 30px; }
+        .section { margin-bottom: 30px; }
+        .section h2 { color: #1E40AF; border-bottom: 2px solid #E5E7EB; padding-bottom: 10px; }
+        table { width: 100%; border-collapse: collapse; margin-top: 15px; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #E5E7EB; }
+        th { background-color: #F9FAFB; font-weight: 600; color: #374151; }
+        .answer-box { background: #EFF6FF; border-left: 4px solid #3B82F6; padding: 20px; border-radius: 5px; }
+        .metric { display: inline-block; background: #F0F9FF; padding: 10px 15px; margin: 5px; border-radius: 5px; border: 1px solid #E0F2FE; }
+        .high-relevance { color: #059669; font-weight: bold; }
+        .medium-relevance { color: #D97706; font-weight: bold; }
+        .low-relevance { color: #DC2626; font-weight: bold; }
+    </style>
+</head>
+<body>
+    <div class="container">
+"""
+
+# Plantillas del reporte HTML (str.format_map)
+_HTML_SUMMARY = """        <div class="header">
+            <h1>📊 Reporte de Análisis RAG</h1>
+            <p>Tigo Honduras - Inteligencia de Mercado</p>
+            <p>Generado: {timestamp}</p>
+        </div>
+        
+        <div class="section">
+            <h2>📋 Resumen Ejecutivo</h2>
+            <div class="metric">🎯 Consulta: {query_processed}</div>
+            <div class="metric">📚 Documentos: {total_documents}</div>
+            <div class="metric">⏱️ Tiempo: {processing_time:.2f}s</div>
+            <div class="metric">🎯 Confianza: {confidence:.0%}</div>
+            <div class="metric">🔧 Modo: {mode}</div>
+        </div>
+        
+        <div class="section">
+            <h2>💡 Respuesta del Sistema</h2>
+            <div class="answer-box">
+                {answer}
+            </div>
+        </div>
+        
+        <div class="section">
+            <h2>📑 Documentos Fuente</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>#</th>
+                        <th>Documento</th>
+                        <th>Año</th>
+                        <th>Tipo</th>
+                        <th>Similaridad</th>
+                        <th>Relevancia</th>
+                    </tr>
+                </thead>
+                <tbody>
+"""
+
+_HTML_DOCUMENT_ROW = """
+                    <tr>
+                        <td>{id}</td>
+                        <td>{document_name}</td>
+                        <td>{year}</td>
+                        <td>{study_type}</td>
+                        <td>{similarity_score:.4f}</td>
+                        <td class="{relevance_class}">{relevance}</td>
+                    </tr>
+"""
+
+_HTML_DOCUMENTS_END = """
+                </tbody>
+            </table>
+        </div>
+        
+        <div class="section">
+            <h2>📊 Datos Extraídos</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Tipo</th>
+                        <th>Descripción</th>
+                        <th>Valor</th>
+                        <th>Categoría</th>
+                    </tr>
+                </thead>
+                <tbody>
+"""
+
+_HTML_EXTRACTED_ROW = """
+                    <tr>
+                        <td>{type}</td>
+                        <td>{description}</td>
+                        <td><strong>{value}</strong></td>
+                        <td>{category}</td>
+                    </tr>
+"""
+
+_HTML_FOOTER = """
+                </tbody>
+            </table>
+        </div>
+        
+        <div class="section" style="margin-top: 40px; text-align: center; color: #6B7280;">
+            <p>📈 Generado por Sistema RAG Tigo Honduras v1.0</p>
+            <p>🕐 {generated_at}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
 
 
 class RAGDataExporter:
@@ -19,6 +211,8 @@ class RAGDataExporter:
     
     def __init__(self):
         self.supported_formats = ["excel", "csv", "json", "html"]
+        # Buffer de Excel reutilizado por hilo: conserva su capacidad entre exportaciones
+        self._local = threading.local()
     
     def export_rag_response(self, 
                           rag_response: Dict[str, Any], 
@@ -31,19 +225,22 @@ class RAGDataExporter:
         if format_type not in self.supported_formats:
             return {"error": f"Formato no soportado. Disponibles: {self.supported_formats}"}
         
+        # Una sola lectura del reloj por exportación (timestamps y nombres de archivo)
+        now = datetime.now()
+        
         # Extraer datos estructurados de la respuesta
-        structured_data = self._extract_structured_data(rag_response)
+        structured_data = self._extract_structured_data(rag_response, now)
         
         if format_type == "excel":
-            return self._export_to_excel(structured_data, include_metadata)
+            return self._export_to_excel(structured_data, include_metadata, now)
         elif format_type == "csv":
-            return self._export_to_csv(structured_data, include_metadata)
+            return self._export_to_csv(structured_data, include_metadata, now)
         elif format_type == "json":
-            return self._export_to_json(structured_data, include_metadata)
+            return self._export_to_json(structured_data, include_metadata, now)
         elif format_type == "html":
-            return self._export_to_html(structured_data, include_metadata)
+            return self._export_to_html(structured_data, include_metadata, now)
     
-    def _extract_structured_data(self, rag_response: Dict[str, Any]) -> Dict[str, Any]:
+    def _extract_structured_data(self, rag_response: Dict[str, Any], now: datetime) -> Dict[str, Any]:
         """
         Extrae datos estructurados de la respuesta RAG
         """
@@ -62,7 +259,7 @@ class RAGDataExporter:
                 "processing_time": metadata.get("processing_time_seconds", 0),
                 "confidence": metadata.get("confidence", 0),
                 "mode": metadata.get("mode", "unknown"),
-                "timestamp": rag_response.get("timestamp", datetime.now().isoformat())
+                "timestamp": rag_response["timestamp"] if "timestamp" in rag_response else now.isoformat()
             },
             "documents": self._format_citations_for_export(citations),
             "extracted_data": numerical_data,
@@ -76,48 +273,45 @@ class RAGDataExporter:
         """
         Extrae datos numéricos y porcentajes del texto
         """
-        import re
-        
-        numerical_data = []
+        # Respuestas vacías o sin porcentajes: se evitan los tres recorridos con regex
+        if '%' not in text or not _DIGIT_PERCENT_RE.search(text):
+            return []
         
         # Buscar porcentajes con contexto
-        percentage_pattern = r'(\w+[^.]*?)(\d+%)'
-        matches = re.findall(percentage_pattern, text)
-        
-        for i, (context, percentage) in enumerate(matches):
-            numerical_data.append({
-                "id": f"percentage_{i+1}",
+        numerical_data = [
+            {
+                "id": f"percentage_{i}",
                 "type": "percentage",
                 "value": percentage,
                 "context": context.strip(),
-                "category": "demographic" if any(word in context.lower() for word in ["edad", "años", "género", "hombres", "mujeres"]) else "general"
-            })
+                "category": "demographic" if _DEMOGRAPHIC_RE.search(context.lower()) else "general"
+            }
+            for i, (context, percentage) in enumerate(_PERCENTAGE_RE.findall(text), start=1)
+        ]
         
         # Buscar datos demográficos específicos
-        age_pattern = r'(\d+)\s*a\s*(\d+)\s*años.*?(\d+%)'
-        age_matches = re.findall(age_pattern, text)
-        
-        for i, (age_start, age_end, percentage) in enumerate(age_matches):
-            numerical_data.append({
-                "id": f"age_group_{i+1}",
+        numerical_data.extend(
+            {
+                "id": f"age_group_{i}",
                 "type": "age_distribution",
                 "age_range": f"{age_start}-{age_end} años",
                 "percentage": percentage,
                 "category": "demographics"
-            })
+            }
+            for i, (age_start, age_end, percentage) in enumerate(_AGE_RE.findall(text), start=1)
+        )
         
         # Buscar ciudades con porcentajes
-        city_pattern = r'(Tegucigalpa|San Pedro Sula|Choloma|Comayagua|La Ceiba)[^.]*?(\d+%)'
-        city_matches = re.findall(city_pattern, text, re.IGNORECASE)
-        
-        for i, (city, percentage) in enumerate(city_matches):
-            numerical_data.append({
-                "id": f"city_{i+1}",
+        numerical_data.extend(
+            {
+                "id": f"city_{i}",
                 "type": "geographic_distribution",
                 "city": city,
                 "percentage": percentage,
                 "category": "geography"
-            })
+            }
+            for i, (city, percentage) in enumerate(_CITY_RE.findall(text), start=1)
+        )
         
         return numerical_data
     
@@ -127,33 +321,37 @@ class RAGDataExporter:
         """
         formatted_citations = []
         
-        for i, citation in enumerate(citations):
+        for i, citation in enumerate(citations, start=1):
+            # Una sola lectura de la similaridad por citación
+            similarity = citation.get("similarity", 0)
             formatted_citations.append({
-                "id": i + 1,
+                "id": i,
                 "document_name": citation.get("document", "N/A"),
                 "study_type": citation.get("study_type", "Unknown"),
                 "year": citation.get("year", "N/A"),
                 "section": citation.get("section", "N/A"),
-                "similarity_score": citation.get("similarity", 0),
-                "relevance": "High" if citation.get("similarity", 0) > 0.02 else "Medium" if citation.get("similarity", 0) > 0.01 else "Low"
+                "similarity_score": similarity,
+                "relevance": "High" if similarity > 0.02 else "Medium" if similarity > 0.01 else "Low"
             })
         
         return formatted_citations
     
-    def _export_to_excel(self, data: Dict[str, Any], include_metadata: bool) -> Dict[str, Any]:
+    def _export_to_excel(self, data: Dict[str, Any], include_metadata: bool, now: datetime) -> Dict[str, Any]:
         """
         Exporta a Excel con múltiples hojas
         """
         try:
-            # Crear buffer en memoria
-            output = io.BytesIO()
+            # Buffer en memoria reutilizado; se sobrescribe desde el inicio
+            output = self._excel_buffer()
             
-            # Crear writer de Excel
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            # Crear writer de Excel (xlsxwriter: solo escritura, más rápido que openpyxl).
+            # Sin constant_memory: pandas escribe por columnas y ese modo descarta celdas.
+            with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs=_XLSX_ENGINE_KWARGS) as writer:
+                # Las hojas de una sola fila se escriben directo, sin el formateador celda a celda de pandas
+                header_format = writer.book.add_format(_XLSX_HEADER_FORMAT)
                 
                 # Hoja 1: Resumen
-                summary_df = pd.DataFrame([data["summary"]])
-                summary_df.to_excel(writer, sheet_name='Resumen', index=False)
+                self._write_single_row_sheet(writer, 'Resumen', data["summary"], header_format)
                 
                 # Hoja 2: Documentos fuente
                 if data["documents"]:
@@ -166,81 +364,123 @@ class RAGDataExporter:
                     extracted_df.to_excel(writer, sheet_name='Datos_Extraidos', index=False)
                 
                 # Hoja 4: Respuesta completa
-                answer_df = pd.DataFrame([{"respuesta_completa": data["full_answer"]}])
-                answer_df.to_excel(writer, sheet_name='Respuesta_Completa', index=False)
+                self._write_single_row_sheet(writer, 'Respuesta_Completa',
+                                             {"respuesta_completa": data["full_answer"]}, header_format)
                 
                 # Hoja 5: Metadata (si se incluye)
                 if include_metadata and data["metadata"]:
-                    # Aplanar metadata para DataFrame
+                    # Aplanar metadata en una sola fila
                     flattened_metadata = self._flatten_dict(data["metadata"])
-                    metadata_df = pd.DataFrame([flattened_metadata])
-                    metadata_df.to_excel(writer, sheet_name='Metadata', index=False)
+                    self._write_single_row_sheet(writer, 'Metadata', flattened_metadata, header_format)
+            
+            # El archivo ocupa [0, tell()); lo que sigue son restos de exportaciones anteriores
+            excel_size = output.tell()
             
-            # Obtener datos del buffer
-            output.seek(0)
-            excel_data = output.getvalue()
+            # Codificar en base64 para transferencia (sin copiar el buffer)
+            with output.getbuffer() as view:
+                excel_b64 = _b64encode_str(view[:excel_size])
             
-            # Codificar en base64 para transferencia
-            excel_b64 = base64.b64encode(excel_data).decode('utf-8')
+            # Un export excepcionalmente grande no deja su buffer retenido en el hilo
+            if excel_size > EXCEL_BUFFER_MAX_RETAINED:
+                self._local.excel_buffer = None
             
             return {
                 "success": True,
                 "format": "excel",
-                "filename": f"tigo_rag_export_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                "filename": f"tigo_rag_export_{now.strftime('%Y%m%d_%H%M')}.xlsx",
                 "data": excel_b64,
-                "size_bytes": len(excel_data),
+                "size_bytes": excel_size,
                 "sheets": ["Resumen", "Documentos", "Datos_Extraidos", "Respuesta_Completa"] + (["Metadata"] if include_metadata else [])
             }
             
         except Exception as e:
             return {"error": f"Error exportando a Excel: {str(e)}"}
     
-    def _export_to_csv(self, data: Dict[str, Any], include_metadata: bool) -> Dict[str, Any]:
+    def _excel_buffer(self) -> io.BytesIO:
+        """
+        BytesIO del hilo actual, posicionado al inicio. No se trunca: truncate() libera la memoria
+        y el siguiente archivo volvería a crecer el buffer por realocaciones sucesivas.
+        """
+        buffer = getattr(self._local, "excel_buffer", None)
+        if buffer is None:
+            buffer = self._local.excel_buffer = io.BytesIO()
+        buffer.seek(0)
+        return buffer
+    
+    def _write_single_row_sheet(self, writer: pd.ExcelWriter, sheet_name: str,
+                                row: Dict[str, Any], header_format) -> None:
+        """
+        Escribe una hoja de encabezado + una fila con xlsxwriter
+        """
+        worksheet = writer.book.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, list(row.keys()), header_format)
+        worksheet.write_row(1, 0, [self._excel_cell(value) for value in row.values()])
+    
+    @staticmethod
+    def _excel_cell(value: Any) -> Any:
+        """
+        Valor de celda para xlsxwriter: solo acepta escalares (el resto se escribe como texto)
+        y falla con NaN/inf, que to_excel dejaba como celdas vacías
+        """
+        if isinstance(value, float):
+            return value if math.isfinite(value) else None
+        if value is None or isinstance(value, (str, int, bool)):
+            return value
+        return str(value)
+    
+    def _export_to_csv(self, data: Dict[str, Any], include_metadata: bool, now: datetime) -> Dict[str, Any]:
         """
         Exporta a CSV (solo datos tabulares principales)
         """
         try:
-            # Combinar documentos y datos extraídos en un CSV
-            all_data = []
+            documents = data["documents"]
+            extracted = data["extracted_data"]
+            
+            # Mismas columnas y orden que producía pd.DataFrame(lista_de_dicts).to_csv(index=False)
+            if documents:
+                header = _CSV_DOCUMENT_COLUMNS + (_CSV_EXTRACTED_ONLY_COLUMNS if extracted else ())
+            else:
+                header = _CSV_EXTRACTED_COLUMNS if extracted else ()
+            
+            # Columnas numéricas de los documentos con la misma inferencia de tipos que pandas
+            years = _csv_numeric_column([doc["year"] for doc in documents], bool(extracted))
+            similarities = _csv_numeric_column([doc["similarity_score"] for doc in documents], bool(extracted))
             
             # Agregar documentos
-            for doc in data["documents"]:
-                all_data.append({
-                    "tipo": "documento",
-                    "nombre": doc["document_name"],
-                    "año": doc["year"],
-                    "similaridad": doc["similarity_score"],
-                    "relevancia": doc["relevance"],
-                    "categoria": "fuente"
-                })
+            rows = [
+                ("documento", doc["document_name"], year, similarity, doc["relevance"], "fuente")
+                + ((None, None) if extracted else ())
+                for doc, year, similarity in zip(documents, years, similarities)
+            ]
             
             # Agregar datos extraídos
-            for item in data["extracted_data"]:
-                all_data.append({
-                    "tipo": "dato_extraido",
-                    "nombre": item.get("context", item.get("city", item.get("age_range", "N/A"))),
-                    "valor": item.get("value", item.get("percentage", "N/A")),
-                    "categoria": item["category"],
-                    "tipo_dato": item["type"]
-                })
+            for item in extracted:
+                name = item.get("context", item.get("city", item.get("age_range", "N/A")))
+                value = item.get("value", item.get("percentage", "N/A"))
+                if documents:
+                    rows.append(("dato_extraido", name, None, None, None, item["category"], value, item["type"]))
+                else:
+                    rows.append(("dato_extraido", name, value, item["category"], item["type"]))
             
-            # Crear DataFrame y CSV
-            df = pd.DataFrame(all_data)
-            csv_data = df.to_csv(index=False)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerow(header)
+            writer.writerows(rows)
+            csv_data = buffer.getvalue()
             
             return {
                 "success": True,
                 "format": "csv",
-                "filename": f"tigo_rag_export_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                "filename": f"tigo_rag_export_{now.strftime('%Y%m%d_%H%M')}.csv",
                 "data": csv_data,
                 "size_bytes": len(csv_data.encode()),
-                "records": len(all_data)
+                "records": len(rows)
             }
             
         except Exception as e:
             return {"error": f"Error exportando a CSV: {str(e)}"}
     
-    def _export_to_json(self, data: Dict[str, Any], include_metadata: bool) -> Dict[str, Any]:
+    def _export_to_json(self, data: Dict[str, Any], include_metadata: bool, now: datetime) -> Dict[str, Any]:
         """
         Exporta a JSON estructurado
         """
@@ -248,7 +488,7 @@ class RAGDataExporter:
             export_data = {
                 "export_info": {
                     "format": "json",
-                    "exported_at": datetime.now().isoformat(),
+                    "exported_at": now.isoformat(),
                     "tigo_rag_version": "1.0"
                 },
                 "summary": data["summary"],
@@ -260,150 +500,71 @@ class RAGDataExporter:
             if include_metadata:
                 export_data["metadata"] = data["metadata"]
             
-            json_data = json.dumps(export_data, indent=2, ensure_ascii=False)
+            try:
+                json_bytes = orjson.dumps(export_data, option=_ORJSON_OPTIONS)
+                json_data = json_bytes.decode("utf-8")
+            except orjson.JSONEncodeError:
+                # Enteros de más de 64 bits o surrogates sueltos: se delega en json
+                json_data = json.dumps(export_data, indent=2, ensure_ascii=False)
+                json_bytes = json_data.encode()
             
             return {
                 "success": True,
                 "format": "json",
-                "filename": f"tigo_rag_export_{datetime.now().strftime('%Y%m%d_%H%M')}.json",
+                "filename": f"tigo_rag_export_{now.strftime('%Y%m%d_%H%M')}.json",
                 "data": json_data,
-                "size_bytes": len(json_data.encode()),
+                "size_bytes": len(json_bytes),
                 "structure": list(export_data.keys())
             }
             
         except Exception as e:
             return {"error": f"Error exportando a JSON: {str(e)}"}
     
-    def _export_to_html(self, data: Dict[str, Any], include_metadata: bool) -> Dict[str, Any]:
+    def _export_to_html(self, data: Dict[str, Any], include_metadata: bool, now: datetime) -> Dict[str, Any]:
         """
         Exporta a HTML con formato de reporte
         """
         try:
-            html_content = f"""
-<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Reporte RAG - Tigo Honduras</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
-        .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-        .header {{ background: linear-gradient(135deg, #1E40AF, #3B82F6); color: white; padding: 20px; border-radius: 10px; margin-bottom: 30px; }}
-        .section {{ margin-bottom: 30px; }}
-        .section h2 {{ color: #1E40AF; border-bottom: 2px solid #E5E7EB; padding-bottom: 10px; }}
-        table {{ width: 100%; border-collapse: collapse; margin-top: 15px; }}
-        th, td {{ padding: 12px; text-align: left; border-bottom: 1px solid #E5E7EB; }}
-        th {{ background-color: #F9FAFB; font-weight: 600; color: #374151; }}
-        .answer-box {{ background: #EFF6FF; border-left: 4px solid #3B82F6; padding: 20px; border-radius: 5px; }}
-        .metric {{ display: inline-block; background: #F0F9FF; padding: 10px 15px; margin: 5px; border-radius: 5px; border: 1px solid #E0F2FE; }}
-        .high-relevance {{ color: #059669; font-weight: bold; }}
-        .medium-relevance {{ color: #D97706; font-weight: bold; }}
-        .low-relevance {{ color: #DC2626; font-weight: bold; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📊 Reporte de Análisis RAG</h1>
-            <p>Tigo Honduras - Inteligencia de Mercado</p>
-            <p>Generado: {data['summary']['timestamp']}</p>
-        </div>
-        
-        <div class="section">
-            <h2>📋 Resumen Ejecutivo</h2>
-            <div class="metric">🎯 Consulta: {data['summary']['query_processed']}</div>
-            <div class="metric">📚 Documentos: {data['summary']['total_documents']}</div>
-            <div class="metric">⏱️ Tiempo: {data['summary']['processing_time']:.2f}s</div>
-            <div class="metric">🎯 Confianza: {data['summary']['confidence']:.0%}</div>
-            <div class="metric">🔧 Modo: {data['summary']['mode'].upper()}</div>
-        </div>
-        
-        <div class="section">
-            <h2>💡 Respuesta del Sistema</h2>
-            <div class="answer-box">
-                {data['full_answer'].replace(chr(10), '<br>')}
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>📑 Documentos Fuente</h2>
-            <table>
-                <thead>
-                    <tr>
-                        <th>#</th>
-                        <th>Documento</th>
-                        <th>Año</th>
-                        <th>Tipo</th>
-                        <th>Similaridad</th>
-                        <th>Relevancia</th>
-                    </tr>
-                </thead>
-                <tbody>
-"""
+            summary = data["summary"]
+            # Todo texto proveniente de la respuesta o de los documentos se escapa
+            parts = [_HTML_HEAD, _HTML_SUMMARY.format_map({
+                "timestamp": escape(str(summary["timestamp"])),
+                "query_processed": escape(str(summary["query_processed"])),
+                "total_documents": summary["total_documents"],
+                "processing_time": summary["processing_time"],
+                "confidence": summary["confidence"],
+                "mode": escape(summary["mode"].upper()),
+                "answer": escape(data["full_answer"]).replace(chr(10), '<br>'),
+            })]
             
             for doc in data["documents"]:
-                relevance_class = f"{doc['relevance'].lower()}-relevance"
-                html_content += f"""
-                    <tr>
-                        <td>{doc['id']}</td>
-                        <td>{doc['document_name']}</td>
-                        <td>{doc['year']}</td>
-                        <td>{doc['study_type']}</td>
-                        <td>{doc['similarity_score']:.4f}</td>
-                        <td class="{relevance_class}">{doc['relevance']}</td>
-                    </tr>
-"""
+                parts.append(_HTML_DOCUMENT_ROW.format_map({
+                    "id": doc["id"],
+                    "document_name": escape(str(doc["document_name"])),
+                    "year": escape(str(doc["year"])),
+                    "study_type": escape(str(doc["study_type"])),
+                    "similarity_score": doc["similarity_score"],
+                    "relevance_class": escape(f"{doc['relevance'].lower()}-relevance"),
+                    "relevance": escape(doc["relevance"]),
+                }))
             
-            html_content += """
-                </tbody>
-            </table>
-        </div>
-        
-        <div class="section">
-            <h2>📊 Datos Extraídos</h2>
-            <table>
-                <thead>
-                    <tr>
-                        <th>Tipo</th>
-                        <th>Descripción</th>
-                        <th>Valor</th>
-                        <th>Categoría</th>
-                    </tr>
-                </thead>
-                <tbody>
-"""
+            parts.append(_HTML_DOCUMENTS_END)
             
             for item in data["extracted_data"]:
-                description = item.get("context", item.get("city", item.get("age_range", "N/A")))
-                value = item.get("value", item.get("percentage", "N/A"))
-                html_content += f"""
-                    <tr>
-                        <td>{item['type'].replace('_', ' ').title()}</td>
-                        <td>{description}</td>
-                        <td><strong>{value}</strong></td>
-                        <td>{item['category'].title()}</td>
-                    </tr>
-"""
+                parts.append(_HTML_EXTRACTED_ROW.format_map({
+                    "type": escape(item["type"].replace("_", " ").title()),
+                    "description": escape(str(item.get("context", item.get("city", item.get("age_range", "N/A"))))),
+                    "value": escape(str(item.get("value", item.get("percentage", "N/A")))),
+                    "category": escape(item["category"].title()),
+                }))
             
-            html_content += f"""
-                </tbody>
-            </table>
-        </div>
-        
-        <div class="section" style="margin-top: 40px; text-align: center; color: #6B7280;">
-            <p>📈 Generado por Sistema RAG Tigo Honduras v1.0</p>
-            <p>🕐 {datetime.now().strftime('%d/%m/%Y a las %H:%M')}</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
+            parts.append(_HTML_FOOTER.format_map({"generated_at": now.strftime('%d/%m/%Y a las %H:%M')}))
+            html_content = "".join(parts)
             
             return {
                 "success": True,
                 "format": "html",
-                "filename": f"tigo_rag_report_{datetime.now().strftime('%Y%m%d_%H%M')}.html",
+                "filename": f"tigo_rag_report_{now.strftime('%Y%m%d_%H%M')}.html",
                 "data": html_content,
                 "size_bytes": len(html_content.encode()),
                 "sections": ["Resumen", "Respuesta", "Documentos", "Datos Extraídos"]
@@ -416,13 +577,17 @@ class RAGDataExporter:
         """
         Aplana un diccionario anidado para crear un DataFrame
         """
-        items = []
-        for k, v in d.items():
-            new_key = f"{parent_key}{sep}{k}" if parent_key else k
-            if isinstance(v, dict):
-                items.extend(self._flatten_dict(v, new_key, sep=sep).items())
-            elif isinstance(v, list):
-                items.append((new_key, str(v)))
+        flattened = {}
+        # Pila de iteradores en vez de recursión: mismo orden de claves, un solo dict de salida
+        stack = [(parent_key, iter(d.items()))]
+        while stack:
+            prefix, items = stack[-1]
+            for k, v in items:
+                new_key = f"{prefix}{sep}{k}" if prefix else k
+                if isinstance(v, dict):
+                    stack.append((new_key, iter(v.items())))
+                    break
+                flattened[new_key] = str(v) if isinstance(v, list) else v
             else:
-                items.append((new_key, v))
-        return dict(items)
\ No newline at end of file
+                stack.pop()
+        return flattened
\ No newline at end of file
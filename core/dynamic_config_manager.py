@@ -4,11 +4,62 @@ Sistema de Configuración Dinámica Multi-Cliente
 Carga configuraciones específicas por cliente y mantiene neutralidad en el core
 """
 
-import json
+import logging
 import os
-from typing import Dict, Any, Optional, List
+import string
+from collections import ChainMap
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Mapping, Tuple
 from datetime import datetime
 
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Prompts interpolados que se conservan por (cliente, modo, rag_percentage)
+PROMPT_CACHE_SIZE = 256
+
+
+def _load_json_config(path: str) -> Dict[str, Any]:
+    """Carga un JSON de configuración con orjson"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+# Claves de contexto genéricas, consultadas después de "<cliente>_context"
+_GENERIC_CONTEXT_KEYS = ("client_context", "brand_context")
+
+
+def _join_context_list(context: Dict[str, Any], key: str, default: str) -> str:
+    """Une con ', ' la lista context[key]; usa default si la clave no existe"""
+    return ', '.join(context.get(key, (default,)))
+
+
+@lru_cache(maxsize=None)
+def _compile_template(template: str) -> Optional[Tuple[Tuple[str, Optional[str], str], ...]]:
+    """
+    Parsea un template de prompt una sola vez a tuplas (literal, campo, format_spec).
+
+    Devuelve None si el template usa campos posicionales, atributos/índices o
+    conversiones (!r, !s); en ese caso se interpola con str.format.
+    """
+    compiled = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if field is not None and (not field.isidentifier() or conversion or '{' in spec):
+            return None
+        compiled.append((literal, field, spec))
+    return tuple(compiled)
+
+
+def _render_template(template: str, values: Mapping[str, Any]) -> str:
+    """Equivalente a template.format_map(values) usando el template precompilado"""
+    compiled = _compile_template(template)
+    if compiled is None:
+        return template.format_map(values)
+    return ''.join([
+        literal + format(values[field], spec) if field is not None else literal
+        for literal, field, spec in compiled
+    ])
 
 class DynamicConfigManager:
     """
@@ -24,20 +75,27 @@ class DynamicConfigManager:
         self.base_config = self._load_base_config()
         self.client_configs = {}
         self.active_client = None
+        # Se vacía con self._cached_prompt.cache_clear() al (re)cargar un cliente
+        self._cached_prompt = lru_cache(maxsize=PROMPT_CACHE_SIZE)(self._build_prompt)
 
-        print("✅ Dynamic Config Manager initialized")
-        print(f"   📋 Base config: {base_config_path}")
-        print(f"   🎛️ Modes available: {', '.join(self.base_config['rag_modes'].keys())}")
+        # Precompilar los templates de todos los modos al cargar la configuración
+        for mode_config in self.base_config['rag_modes'].values():
+            template = mode_config.get('system_prompt_template')
+            if isinstance(template, str):
+                _compile_template(template)
+
+        logger.info("✅ Dynamic Config Manager initialized")
+        logger.info("   📋 Base config: %s", base_config_path)
+        logger.info("   🎛️ Modes available: %s", ', '.join(self.base_config['rag_modes'].keys()))
 
     def _load_base_config(self) -> Dict[str, Any]:
         """Carga la configuración base neutral"""
         try:
-            with open(self.base_config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            print(f"✅ Base config loaded: v{config.get('version', '1.0')}")
+            config = _load_json_config(self.base_config_path)
+            logger.info("✅ Base config loaded: v%s", config.get('version', '1.0'))
             return config
         except Exception as e:
-            print(f"❌ Error loading base config: {e}")
+            logger.error("❌ Error loading base config: %s", e)
             return self._get_fallback_config()
 
     def _get_fallback_config(self) -> Dict[str, Any]:
@@ -69,8 +127,7 @@ class DynamicConfigManager:
             if not config_path:
                 config_path = f"config/{client_name.lower()}_config.json"
 
-            with open(config_path, 'r', encoding='utf-8') as f:
-                client_config = json.load(f)
+            client_config = _load_json_config(config_path)
 
             # Extraer datos del cliente para interpolación
             client_data = self._extract_client_data(client_config)
@@ -81,47 +138,42 @@ class DynamicConfigManager:
                 "loaded_at": datetime.now().isoformat(),
                 "config_path": config_path
             }
+            self._cached_prompt.cache_clear()
 
-            print(f"✅ Client config loaded: {client_name}")
-            print(f"   📁 Path: {config_path}")
-            print(f"   🏢 Industry: {client_data.get('industry', 'Unknown')}")
-            print(f"   🌍 Market: {client_data.get('market', 'Unknown')}")
+            logger.info("✅ Client config loaded: %s", client_name)
+            logger.info("   📁 Path: %s", config_path)
+            logger.info("   🏢 Industry: %s", client_data.get('industry', 'Unknown'))
+            logger.info("   🌍 Market: %s", client_data.get('market', 'Unknown'))
 
             return True
 
         except Exception as e:
-            print(f"❌ Error loading client config for {client_name}: {e}")
+            logger.error("❌ Error loading client config for %s: %s", client_name, e)
             return False
 
     def _extract_client_data(self, client_config: Dict[str, Any]) -> Dict[str, str]:
         """Extrae datos del cliente para interpolación de placeholders"""
 
-        # Obtener contexto del cliente (alqueria_context, tigo_context, etc.)
-        client_context = None
-        possible_contexts = [
-            f"{client_config.get('client_info', {}).get('name', '').lower()}_context",
-            "client_context",
-            "brand_context"
-        ]
+        client_info = client_config.get('client_info', {})
 
-        for context_key in possible_contexts:
-            if context_key in client_config:
-                client_context = client_config[context_key]
-                break
+        # Obtener contexto del cliente (alqueria_context, tigo_context, etc.) en orden de prioridad
+        context_keys = (f"{client_info.get('name', '').lower()}_context",) + _GENERIC_CONTEXT_KEYS
+        context_key = next((key for key in context_keys if key in client_config), None)
+        client_context = client_config[context_key] if context_key else None
 
         # Si no encuentra contexto específico, usar valores de client_info
         if not client_context:
-            client_context = client_config.get('client_info', {})
+            client_context = client_info
 
         # Extraer datos para interpolación
         extracted_data = {
-            "client_name": client_config.get('client_info', {}).get('name', 'Cliente'),
-            "industry": client_config.get('client_info', {}).get('industry', 'General'),
-            "market": client_config.get('client_info', {}).get('market', 'General'),
+            "client_name": client_info.get('name', 'Cliente'),
+            "industry": client_info.get('industry', 'General'),
+            "market": client_info.get('market', 'General'),
             "brand_positioning": client_context.get('brand_positioning', 'Empresa líder'),
-            "main_competitors": ', '.join(client_context.get('main_competitors', ['Competencia'])),
-            "key_markets": ', '.join(client_context.get('key_markets', ['Mercado Principal'])),
-            "segments": ', '.join(client_context.get('segments', ['Segmento General']))
+            "main_competitors": _join_context_list(client_context, 'main_competitors', 'Competencia'),
+            "key_markets": _join_context_list(client_context, 'key_markets', 'Mercado Principal'),
+            "segments": _join_context_list(client_context, 'segments', 'Segmento General')
         }
 
         return extracted_data
@@ -132,11 +184,11 @@ class DynamicConfigManager:
         """
         if client_name in self.client_configs:
             self.active_client = client_name
-            print(f"✅ Active client set: {client_name}")
+            logger.debug("✅ Active client set: %s", client_name)
             return True
         else:
-            print(f"❌ Client not found: {client_name}")
-            print(f"   Available clients: {', '.join(self.client_configs.keys())}")
+            logger.warning("❌ Client not found: %s", client_name)
+            logger.warning("   Available clients: %s", ', '.join(self.client_configs.keys()))
             return False
 
     def get_system_prompt(self, mode: str, rag_percentage: Optional[int] = None) -> str:
@@ -148,38 +200,39 @@ class DynamicConfigManager:
             rag_percentage: Porcentaje RAG para modos configurables
         """
         try:
-            # Obtener template base
-            mode_config = self.base_config['rag_modes'].get(mode, {})
-            prompt_template = mode_config.get('system_prompt_template',
-                                            "Eres un asistente de análisis de {client_name}.")
-
-            # Obtener datos del cliente activo
-            if self.active_client and self.active_client in self.client_configs:
-                client_data = self.client_configs[self.active_client]['data']
-            else:
-                client_data = self.base_config.get('default_values', {})
-
-            # Calcular porcentajes dinámicos
-            if rag_percentage is not None:
-                client_data['rag_percentage'] = rag_percentage
-                client_data['creativity_percentage'] = 100 - rag_percentage
-                client_data['llm_percentage'] = 100 - rag_percentage
-            else:
-                default_rag = mode_config.get('default_rag_percentage', 100)
-                client_data['rag_percentage'] = default_rag
-                client_data['creativity_percentage'] = 100 - default_rag
-                client_data['llm_percentage'] = 100 - default_rag
-
-            # Interpolar placeholders
-            interpolated_prompt = prompt_template.format(**client_data)
-
-            return interpolated_prompt
+            return self._cached_prompt(self.active_client, mode, rag_percentage)
 
         except Exception as e:
-            print(f"❌ Error generating system prompt: {e}")
+            logger.error("❌ Error generating system prompt: %s", e)
+            client_data = self._get_client_data(self.active_client)
             fallback = f"Eres un asistente de análisis para {client_data.get('client_name', 'Cliente')}."
             return fallback
 
+    def _get_client_data(self, client_name: Optional[str]) -> Dict[str, Any]:
+        """Datos de interpolación del cliente indicado o los valores por defecto"""
+        if client_name and client_name in self.client_configs:
+            return self.client_configs[client_name]['data']
+        return self.base_config.get('default_values', {})
+
+    def _build_prompt(self, client_name: Optional[str], mode: str, rag_percentage: Optional[int]) -> str:
+        """Interpola el template del modo; se cachea por (cliente, modo, rag_percentage)"""
+        # Obtener template base
+        mode_config = self.base_config['rag_modes'].get(mode, {})
+        prompt_template = mode_config.get('system_prompt_template',
+                                        "Eres un asistente de análisis de {client_name}.")
+
+        # Calcular porcentajes dinámicos sin modificar los datos guardados del cliente
+        if rag_percentage is None:
+            rag_percentage = mode_config.get('default_rag_percentage', 100)
+        percentages = {
+            'rag_percentage': rag_percentage,
+            'creativity_percentage': 100 - rag_percentage,
+            'llm_percentage': 100 - rag_percentage
+        }
+
+        # Interpolar placeholders sobre una vista (porcentajes primero), sin copiar client_data
+        return _render_template(prompt_template, ChainMap(percentages, self._get_client_data(client_name)))
+
     def get_mode_config(self, mode: str) -> Dict[str, Any]:
         """Obtiene configuración completa de un modo"""
         return self.base_config['rag_modes'].get(mode, {})
@@ -190,12 +243,7 @@ class DynamicConfigManager:
 
     def get_client_info(self, client_name: Optional[str] = None) -> Dict[str, Any]:
         """Obtiene información de un cliente específico o el activo"""
-        target_client = client_name or self.active_client
-
-        if target_client and target_client in self.client_configs:
-            return self.client_configs[target_client]['data']
-        else:
-            return self.base_config.get('default_values', {})
+        return self._get_client_data(client_name or self.active_client)
 
     def list_clients(self) -> List[str]:
         """Lista todos los clientes cargados"""
@@ -240,5 +288,5 @@ def initialize_with_common_clients() -> DynamicConfigManager:
             if manager.load_client_config(client_name, config_path):
                 loaded_count += 1
 
-    print(f"✅ Auto-loaded {loaded_count} client configurations")
+    logger.info("✅ Auto-loaded %d client configurations", loaded_count)
     return manager
\ No newline at end of file
@@ -6,9 +6,303 @@ Propone acciones de seguimiento basadas en el contenido de la respuesta
 
 import re
 import json
-from typing import Dict, List, Any, Optional
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 from datetime import datetime
 
+try:
+    import ahocorasick
+except ImportError:  # Opcional: búsqueda de keywords en una sola pasada; sin él se usa "in" por keyword
+    ahocorasick = None
+
+try:
+    import re2
+except ImportError:  # Opcional: motor de regex lineal (google-re2); sin él cada patrón se recorre con re
+    re2 = None
+
+# Análisis por (respuesta, documentos citados) que se conservan: reintentos y re-renders los reutilizan
+ANALYSIS_CACHE_SIZE = 512
+
+# Bloques de categoría ya renderizados; las mismas sugerencias se repiten entre respuestas
+CATEGORY_RENDER_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=CATEGORY_RENDER_CACHE_SIZE)
+def _render_category(title: str, lines: Tuple[str, ...]) -> str:
+    """Bloque de texto de una categoría de sugerencias: título en negrita y una viñeta por item"""
+    return "".join([f"**{title}**\n", *(f"• {line}\n" for line in lines), "\n"])
+
+
+def _findall_item(match: "re.Match") -> Any:
+    """Lo que re.findall devuelve por coincidencia: el texto, el grupo único o la tupla de grupos"""
+    if match.re.groups == 0:
+        return match.group(0)
+    if match.re.groups == 1:
+        return match.group(1) or ''
+    return match.groups('')
+
+
+# str.lower() de cada carácter Latin-1: todos siguen siendo un único carácter Latin-1
+_LATIN1_LOWER_TABLE = bytes(ord(chr(i).lower()) for i in range(256))
+
+
+def _lower(text: str) -> str:
+    """
+    Igual que text.lower(). El texto en español sin emojis cabe en Latin-1 y se pasa
+    a minúsculas con una tabla de bytes, varias veces más rápido que str.lower().
+    """
+    if text.isascii():
+        return text.lower()
+    try:
+        encoded = text.encode('latin-1')
+    except UnicodeEncodeError:
+        return text.lower()
+    return encoded.translate(_LATIN1_LOWER_TABLE).decode('latin-1')
+
+
+# Campo de cada item que generate_suggestion_text muestra, por categoría
+_SUGGESTION_TEXT_FIELDS = {
+    "visualizations": "description",
+    "deep_dive": "description",
+    "related_queries": "query",
+    "follow_up_actions": "description"
+}
+
+
+# Patrones para detectar contenido visualizable
+_VIZ_PATTERNS = {
+    "demographics": [
+        r"(\d+%.*?(años|edad))",
+        r"(hombres?.*?\d+%)",
+        r"(mujeres?.*?\d+%)",
+        r"(género.*?\d+%)",
+        r"(masculino.*?\d+%)",
+        r"(femenino.*?\d+%)"
+    ],
+    "geographic": [
+        r"(Bogotá.*?\d+%)",
+        r"(Medellín.*?\d+%)",
+        r"(Cali.*?\d+%)",
+        r"(Costa Atlántica.*?\d+%)",
+        r"(Eje Cafetero.*?\d+%)",
+        r"(ciudades?.*?\d+%)",
+        r"(región.*?\d+%)"
+    ],
+    "market_share": [
+        r"(Alquería.*?\d+%)",
+        r"(Alpina.*?\d+%)",
+        r"(Colanta.*?\d+%)",
+        r"(competencia.*?\d+%)",
+        r"(marca.*?\d+%)",
+        r"(liderazgo.*?\d+%)"
+    ],
+    "products": [
+        r"(leche.*?\d+%)",
+        r"(yogurt.*?\d+%)",
+        r"(queso.*?\d+%)",
+        r"(mantequilla.*?\d+%)",
+        r"(crema.*?\d+%)",
+        r"(lácteo.*?\d+%)"
+    ],
+    "nutrition": [
+        r"(proteína.*?\d+%)",
+        r"(probiótico.*?\d+%)",
+        r"(deslactosad.*?\d+%)",
+        r"(orgánic.*?\d+%)",
+        r"(natural.*?\d+%)",
+        r"(funcional.*?\d+%)"
+    ]
+}
+
+# Compilados una sola vez por proceso; _suggest_visualizations los reutiliza en cada respuesta.
+# Se aplican sobre la respuesta ya en minúsculas, así que basta con pasar los patrones a
+# minúsculas: sin IGNORECASE, re busca directamente el prefijo literal de cada patrón.
+_VIZ_COMPILED = {
+    viz_type: [re.compile(pattern.lower()) for pattern in patterns]
+    for viz_type, patterns in _VIZ_PATTERNS.items()
+}
+
+# Gráfico que se sugiere por categoría: (type, title, description, priority).
+# Las categorías sin entrada (products, nutrition) no generan sugerencias.
+_VIZ_HANDLERS = {
+    "demographics": (
+        "pie_chart",
+        "Distribución Demográfica",
+        "¿Te gustaría ver un gráfico de torta mostrando la distribución demográfica?",
+        "high"
+    ),
+    "geographic": (
+        "bar_chart",
+        "Distribución Geográfica",
+        "¿Quieres un gráfico de barras con la distribución por ciudades?",
+        "high"
+    ),
+    "market_share": (
+        "pie_chart",
+        "Market Share",
+        "¿Te interesa ver un gráfico de participación de mercado?",
+        "medium"
+    )
+}
+
+# (gráfico, patrón compilado) en orden de declaración, solo de categorías con gráfico
+_VIZ_RULES = tuple(
+    (_VIZ_HANDLERS[viz_type], pattern)
+    for viz_type, patterns in _VIZ_COMPILED.items() if viz_type in _VIZ_HANDLERS
+    for pattern in patterns
+)
+
+# Con RE2, un único Set revisa todas las reglas en una pasada lineal y solo se
+# ejecuta findall en las que tienen coincidencias. \d se escribe como \p{Nd}
+# porque en RE2 es solo ASCII.
+if re2 is not None:
+    _VIZ_PATTERN_SET = re2.Set.SearchSet(re2.Options())
+    for _, _pattern in _VIZ_RULES:
+        _VIZ_PATTERN_SET.Add(_pattern.pattern.replace(r"\d", r"\p{Nd}"))
+    _VIZ_PATTERN_SET.Compile()
+else:
+    _VIZ_PATTERN_SET = None
+
+# Palabras clave para detectar temas profundizables
+_DEEP_KEYWORDS = {
+    "competition": ["alpina", "colanta", "parmalat", "nestlé", "danone", "competencia", "vs", "comparación"],
+    "demographics": ["jóvenes", "edad", "género", "segmento", "consumidor", "hogares", "familias"],
+    "geography": ["bogotá", "medellín", "cali", "costa atlántica", "eje cafetero", "región", "colombia"],
+    "products": ["leche", "yogurt", "yogur", "queso", "lácteo", "mantequilla", "crema", "arequipe", "kumis"],
+    "nutrition": ["proteína", "probiótico", "deslactosada", "orgánico", "natural", "funcional", "calcio", "vitamina"],
+    "marketing": ["campaña", "publicidad", "recordación", "mensaje", "marca", "tradición", "premium"],
+    "satisfaction": ["satisfacción", "experiencia", "calidad", "percepción", "premium", "frescura"],
+    "sustainability": ["sostenible", "sostenibilidad", "orgánico", "natural", "ecológico", "carbono neutro"]
+}
+
+# Mismas keywords como conjuntos, para contar por tema con una intersección
+_DEEP_KEYWORD_SETS = {topic: frozenset(keywords) for topic, keywords in _DEEP_KEYWORDS.items()}
+
+# Keywords distintas de todos los temas; su posición es el índice que devuelve el Set de RE2
+_KEYWORD_LIST = tuple(dict.fromkeys(_keyword for _keywords in _DEEP_KEYWORDS.values() for _keyword in _keywords))
+
+# Una sola pasada sobre la respuesta detecta las keywords de todos los temas: con RE2 un Set
+# (DFA lineal, el más rápido); sin RE2, un autómata Aho-Corasick; sin ninguno, "in" por keyword
+_KEYWORD_SET = None
+_KEYWORD_AUTOMATON = None
+if re2 is not None:
+    _KEYWORD_SET = re2.Set.SearchSet(re2.Options())
+    for _keyword in _KEYWORD_LIST:
+        _KEYWORD_SET.Add(re2.escape(_keyword))
+    _KEYWORD_SET.Compile()
+elif ahocorasick is not None:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _keyword in _KEYWORD_LIST:
+        _KEYWORD_AUTOMATON.add_word(_keyword, _keyword)
+    _KEYWORD_AUTOMATON.make_automaton()
+
+# Templates de sugerencias
+_TEMPLATES = {
+    "visualization": {
+        "pie_chart": "¿Te gustaría que genere un gráfico de torta mostrando la {topic}?",
+        "bar_chart": "¿Quieres un gráfico de barras comparativo de {topic}?", 
+        "line_chart": "¿Te interesa ver un gráfico de tendencia temporal de {topic}?",
+        "table": "¿Necesitas una tabla detallada con los datos de {topic}?"
+    },
+    "deep_dive": {
+        "competition": "¿Quieres profundizar en el análisis competitivo con Alpina y Colanta?",
+        "demographics": "¿Te interesa un análisis más detallado del perfil demográfico?",
+        "geography": "¿Quieres explorar las diferencias regionales en más detalle?",
+        "products": "¿Necesitas comparar el desempeño de diferentes productos lácteos?",
+        "nutrition": "¿Te gustaría analizar los aspectos nutricionales y funcionales en profundidad?",
+        "marketing": "¿Quieres revisar el performance de campañas específicas?",
+        "satisfaction": "¿Te interesa analizar drivers de satisfacción del cliente?",
+        "sustainability": "¿Quieres explorar oportunidades de sostenibilidad en el portafolio lácteo?"
+    },
+    "related_queries": {
+        "competition": [
+            "¿Cuáles son las ventajas competitivas de Alquería vs Alpina y Colanta?",
+            "¿Cómo perciben los consumidores la calidad de los productos lácteos de cada marca?",
+            "¿Qué estrategias de precio están usando los competidores en lácteos premium?"
+        ],
+        "demographics": [
+            "¿Cómo varían las preferencias de lácteos por grupo de edad?",
+            "¿Hay diferencias de consumo lácteo entre hombres y mujeres?",
+            "¿Qué segmentos tienen mayor potencial de crecimiento en lácteos funcionales?"
+        ],
+        "geography": [
+            "¿Cuál es la penetración de productos Alquería por ciudad colombiana?",
+            "¿Hay diferencias de preferencias lácteas entre regiones?",
+            "¿Dónde están las mayores oportunidades de expansión para lácteos premium?"
+        ],
+        "products": [
+            "¿Qué productos lácteos tienen mayor potencial de innovación?",
+            "¿Cómo se compara el desempeño de leche vs yogurt vs quesos?",
+            "¿Qué nuevas categorías lácteas podría explorar Alquería?"
+        ],
+        "nutrition": [
+            "¿Qué beneficios nutricionales valoran más los consumidores?",
+            "¿Hay oportunidad en lácteos funcionales con probióticos?",
+            "¿Cómo está evolucionando la demanda de productos deslactosados?"
+        ],
+        "sustainability": [
+            "¿Qué iniciativas de sostenibilidad valoran los consumidores?",
+            "¿Cómo puede Alquería liderar en lácteos sostenibles?",
+            "¿Hay oportunidad en empaques eco-amigables para lácteos?"
+        ]
+    }
+}
+
+
+# Temas con consultas relacionadas, en el orden de _DEEP_KEYWORDS; los demás no se revisan
+_RELATED_TOPICS = tuple(topic for topic in _DEEP_KEYWORDS if _TEMPLATES["related_queries"].get(topic))
+
+
+# Sugerencias que guarda el caché de análisis: inmutables y con __slots__; se convierten a
+# dicts nuevos solo al armar la respuesta, así las llamadas no comparten estado mutable
+@dataclass(frozen=True, slots=True)
+class VisualizationSuggestion:
+    """Gráfico sugerido a partir de los datos detectados en la respuesta"""
+    type: str
+    title: str
+    description: str
+    data_detected: tuple
+    priority: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "type": self.type,
+            "title": self.title,
+            "description": self.description,
+            "data_detected": list(self.data_detected),
+            "priority": self.priority
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class DeepDiveSuggestion:
+    """Tema con suficientes keywords en la respuesta para proponer un análisis más profundo"""
+    topic: str
+    description: str
+    relevance_score: int
+    available_studies: int
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "topic": self.topic,
+            "description": self.description,
+            "relevance_score": self.relevance_score,
+            "available_studies": self.available_studies
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class RelatedQuerySuggestion:
+    """Consulta relacionada con un tema mencionado en la respuesta"""
+    query: str
+    topic: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"query": self.query, "topic": self.topic, "type": "related_question"}
+
 
 class IntelligentSuggestionEngine:
     """
@@ -16,202 +310,171 @@ class IntelligentSuggestionEngine:
     y propone acciones de seguimiento relevantes
     """
     
+    # Sin __dict__ por instancia; todo el estado está declarado aquí
+    __slots__ = (
+        "_cached_analysis",
+        "_last_analysis",
+        "visualization_patterns",
+        "deep_dive_keywords",
+        "suggestion_templates",
+        "_deep_dive_templates",
+        "_related_query_templates",
+        "_compiled_viz_patterns",
+        "_viz_rules",
+        "_viz_pattern_set",
+        "_keyword_set",
+        "_keyword_automaton"
+    )
+    
     def __init__(self):
-        # Patrones para detectar contenido visualizable
-        self.visualization_patterns = {
-            "demographics": [
-                r"(\d+%.*?(años|edad))",
-                r"(hombres?.*?\d+%)",
-                r"(mujeres?.*?\d+%)",
-                r"(género.*?\d+%)",
-                r"(masculino.*?\d+%)",
-                r"(femenino.*?\d+%)"
-            ],
-            "geographic": [
-                r"(Bogotá.*?\d+%)",
-                r"(Medellín.*?\d+%)",
-                r"(Cali.*?\d+%)",
-                r"(Costa Atlántica.*?\d+%)",
-                r"(Eje Cafetero.*?\d+%)",
-                r"(ciudades?.*?\d+%)",
-                r"(región.*?\d+%)"
-            ],
-            "market_share": [
-                r"(Alquería.*?\d+%)",
-                r"(Alpina.*?\d+%)",
-                r"(Colanta.*?\d+%)",
-                r"(competencia.*?\d+%)",
-                r"(marca.*?\d+%)",
-                r"(liderazgo.*?\d+%)"
-            ],
-            "products": [
-                r"(leche.*?\d+%)",
-                r"(yogurt.*?\d+%)",
-                r"(queso.*?\d+%)",
-                r"(mantequilla.*?\d+%)",
-                r"(crema.*?\d+%)",
-                r"(lácteo.*?\d+%)"
-            ],
-            "nutrition": [
-                r"(proteína.*?\d+%)",
-                r"(probiótico.*?\d+%)",
-                r"(deslactosad.*?\d+%)",
-                r"(orgánic.*?\d+%)",
-                r"(natural.*?\d+%)",
-                r"(funcional.*?\d+%)"
-            ]
-        }
+        # Se vacía con self._cached_analysis.cache_clear() si cambian patrones o keywords
+        self._cached_analysis = lru_cache(maxsize=ANALYSIS_CACHE_SIZE)(self._analyze_content)
+        # Último análisis (answer, documents, resultado): re-invocaciones con la misma respuesta
+        # ya completa lo reutilizan sin pasar por el LRU. Se reemplaza como una sola tupla.
+        self._last_analysis = None
         
-        # Palabras clave para detectar temas profundizables
-        self.deep_dive_keywords = {
-            "competition": ["alpina", "colanta", "parmalat", "nestlé", "danone", "competencia", "vs", "comparación"],
-            "demographics": ["jóvenes", "edad", "género", "segmento", "consumidor", "hogares", "familias"],
-            "geography": ["bogotá", "medellín", "cali", "costa atlántica", "eje cafetero", "región", "colombia"],
-            "products": ["leche", "yogurt", "yogur", "queso", "lácteo", "mantequilla", "crema", "arequipe", "kumis"],
-            "nutrition": ["proteína", "probiótico", "deslactosada", "orgánico", "natural", "funcional", "calcio", "vitamina"],
-            "marketing": ["campaña", "publicidad", "recordación", "mensaje", "marca", "tradición", "premium"],
-            "satisfaction": ["satisfacción", "experiencia", "calidad", "percepción", "premium", "frescura"],
-            "sustainability": ["sostenible", "sostenibilidad", "orgánico", "natural", "ecológico", "carbono neutro"]
-        }
-        
-        # Templates de sugerencias
-        self.suggestion_templates = {
-            "visualization": {
-                "pie_chart": "¿Te gustaría que genere un gráfico de torta mostrando la {topic}?",
-                "bar_chart": "¿Quieres un gráfico de barras comparativo de {topic}?", 
-                "line_chart": "¿Te interesa ver un gráfico de tendencia temporal de {topic}?",
-                "table": "¿Necesitas una tabla detallada con los datos de {topic}?"
-            },
-            "deep_dive": {
-                "competition": "¿Quieres profundizar en el análisis competitivo con Alpina y Colanta?",
-                "demographics": "¿Te interesa un análisis más detallado del perfil demográfico?",
-                "geography": "¿Quieres explorar las diferencias regionales en más detalle?",
-                "products": "¿Necesitas comparar el desempeño de diferentes productos lácteos?",
-                "nutrition": "¿Te gustaría analizar los aspectos nutricionales y funcionales en profundidad?",
-                "marketing": "¿Quieres revisar el performance de campañas específicas?",
-                "satisfaction": "¿Te interesa analizar drivers de satisfacción del cliente?",
-                "sustainability": "¿Quieres explorar oportunidades de sostenibilidad en el portafolio lácteo?"
-            },
-            "related_queries": {
-                "competition": [
-                    "¿Cuáles son las ventajas competitivas de Alquería vs Alpina y Colanta?",
-                    "¿Cómo perciben los consumidores la calidad de los productos lácteos de cada marca?",
-                    "¿Qué estrategias de precio están usando los competidores en lácteos premium?"
-                ],
-                "demographics": [
-                    "¿Cómo varían las preferencias de lácteos por grupo de edad?",
-                    "¿Hay diferencias de consumo lácteo entre hombres y mujeres?",
-                    "¿Qué segmentos tienen mayor potencial de crecimiento en lácteos funcionales?"
-                ],
-                "geography": [
-                    "¿Cuál es la penetración de productos Alquería por ciudad colombiana?",
-                    "¿Hay diferencias de preferencias lácteas entre regiones?",
-                    "¿Dónde están las mayores oportunidades de expansión para lácteos premium?"
-                ],
-                "products": [
-                    "¿Qué productos lácteos tienen mayor potencial de innovación?",
-                    "¿Cómo se compara el desempeño de leche vs yogurt vs quesos?",
-                    "¿Qué nuevas categorías lácteas podría explorar Alquería?"
-                ],
-                "nutrition": [
-                    "¿Qué beneficios nutricionales valoran más los consumidores?",
-                    "¿Hay oportunidad en lácteos funcionales con probióticos?",
-                    "¿Cómo está evolucionando la demanda de productos deslactosados?"
-                ],
-                "sustainability": [
-                    "¿Qué iniciativas de sostenibilidad valoran los consumidores?",
-                    "¿Cómo puede Alquería liderar en lácteos sostenibles?",
-                    "¿Hay oportunidad en empaques eco-amigables para lácteos?"
-                ]
-            }
-        }
+        # Patrones, keywords y templates son constantes del módulo compartidas por todas las instancias
+        self.visualization_patterns = _VIZ_PATTERNS
+        self.deep_dive_keywords = _DEEP_KEYWORDS
+        self.suggestion_templates = _TEMPLATES
+        self._deep_dive_templates = _TEMPLATES["deep_dive"]
+        self._related_query_templates = _TEMPLATES["related_queries"]
+        self._compiled_viz_patterns = _VIZ_COMPILED
+        self._viz_rules = _VIZ_RULES
+        self._viz_pattern_set = _VIZ_PATTERN_SET
+        self._keyword_set = _KEYWORD_SET
+        self._keyword_automaton = _KEYWORD_AUTOMATON
     
     def analyze_response(self, answer: str, citations: List[Dict], metadata: Dict) -> Dict[str, Any]:
         """
         Analiza una respuesta RAG y genera sugerencias inteligentes
         """
+        documents = tuple(c.get("document", "") for c in citations)
+        # El resultado cacheado es inmutable; cada respuesta recibe sus propios dicts
+        last = self._last_analysis
+        if last is not None and last[0] == answer and last[1] == documents:
+            analysis = last[2]
+        else:
+            analysis = self._cached_analysis(answer, documents)
+            self._last_analysis = (answer, documents, analysis)
+        visualizations, deep_dive, related_queries = analysis
         suggestions = {
-            "visualizations": self._suggest_visualizations(answer),
-            "deep_dive": self._suggest_deep_dive(answer, citations),
-            "related_queries": self._suggest_related_queries(answer),
+            "visualizations": [suggestion.to_dict() for suggestion in visualizations],
+            "deep_dive": [suggestion.to_dict() for suggestion in deep_dive],
+            "related_queries": [suggestion.to_dict() for suggestion in related_queries],
             "follow_up_actions": self._suggest_follow_up_actions(answer, metadata)
         }
         
         return self._format_suggestions(suggestions)
     
-    def _suggest_visualizations(self, answer: str) -> List[Dict[str, Any]]:
+    def _analyze_content(self, answer: str, documents: Tuple[str, ...]) -> Tuple[tuple, tuple, tuple]:
+        """Sugerencias que dependen solo del texto y de los documentos; se cachea por ambos"""
+        # Una sola copia en minúsculas por respuesta, compartida por todos los helpers
+        answer_lower = _lower(answer)
+        topic_counts = self._scan_topics(answer_lower)
+        return (
+            tuple(self._suggest_visualizations(answer, answer_lower)),
+            tuple(self._suggest_deep_dive(topic_counts, documents)),
+            tuple(self._suggest_related_queries(topic_counts))
+        )
+    
+    def _find_keywords(self, text_lower: str) -> set:
+        """Keywords (de cualquier tema) contenidas en un texto ya en minúsculas, en una pasada"""
+        if self._keyword_set is not None:
+            return {_KEYWORD_LIST[index] for index in self._keyword_set.Match(text_lower) or ()}
+        if self._keyword_automaton is not None:
+            return {keyword for _, keyword in self._keyword_automaton.iter(text_lower)}
+        return {keyword for keyword in _KEYWORD_LIST if keyword in text_lower}
+    
+    def _scan_topics(self, answer_lower: str) -> Dict[str, int]:
+        """Cuenta, por tema, cuántas de sus keywords distintas aparecen en la respuesta"""
+        found = self._find_keywords(answer_lower)
+        return {topic: len(keyword_set & found) for topic, keyword_set in _DEEP_KEYWORD_SETS.items()}
+    
+    def _count_studies_by_topic(self, documents: Tuple[str, ...]) -> Counter:
+        """Cuántos documentos citados mencionan alguna keyword de cada tema"""
+        studies = Counter()
+        for document in documents:
+            found = self._find_keywords(_lower(document))
+            if found:
+                studies.update(
+                    topic for topic, keyword_set in _DEEP_KEYWORD_SETS.items()
+                    if not keyword_set.isdisjoint(found)
+                )
+        return studies
+    
+    def _suggest_visualizations(self, answer: str, answer_lower: str) -> List[VisualizationSuggestion]:
         """Sugiere visualizaciones basadas en el contenido"""
+        # Todos los patrones terminan en \d+%: sin "%" no hay nada que visualizar
+        if "%" not in answer:
+            return []
+        
         viz_suggestions = []
         
-        for viz_type, patterns in self.visualization_patterns.items():
-            for pattern in patterns:
-                matches = re.findall(pattern, answer.lower(), re.IGNORECASE)
-                if matches:
-                    # Detectar tipo de gráfico más apropiado
-                    if "%" in answer and len(matches) >= 2:
-                        if viz_type == "demographics":
-                            viz_suggestions.append({
-                                "type": "pie_chart",
-                                "title": "Distribución Demográfica",
-                                "description": f"¿Te gustaría ver un gráfico de torta mostrando la distribución demográfica?",
-                                "data_detected": matches[:5],
-                                "priority": "high"
-                            })
-                        elif viz_type == "geographic":
-                            viz_suggestions.append({
-                                "type": "bar_chart", 
-                                "title": "Distribución Geográfica",
-                                "description": f"¿Quieres un gráfico de barras con la distribución por ciudades?",
-                                "data_detected": matches[:5],
-                                "priority": "high"
-                            })
-                        elif viz_type == "market_share":
-                            viz_suggestions.append({
-                                "type": "pie_chart",
-                                "title": "Market Share",
-                                "description": f"¿Te interesa ver un gráfico de participación de mercado?",
-                                "data_detected": matches[:5],
-                                "priority": "medium"
-                            })
+        # Índices (en _VIZ_RULES) de las reglas con alguna coincidencia
+        matched_indexes = None
+        if self._viz_pattern_set is not None:
+            matched_indexes = frozenset(self._viz_pattern_set.Match(answer_lower) or ())
+        
+        for index, (handler, pattern) in enumerate(self._viz_rules):
+            if matched_indexes is not None and index not in matched_indexes:
+                continue
+            # Solo se usan las 5 primeras coincidencias: el recorrido se detiene ahí
+            matches = list(islice(pattern.finditer(answer_lower), 5))
+            if len(matches) < 2:
+                continue
+            
+            chart_type, title, description, priority = handler
+            viz_suggestions.append(VisualizationSuggestion(
+                type=chart_type,
+                title=title,
+                description=description,
+                data_detected=tuple(_findall_item(match) for match in matches),
+                priority=priority
+            ))
+            if len(viz_suggestions) == 3:  # Máximo 3 sugerencias
+                break
         
-        return viz_suggestions[:3]  # Máximo 3 sugerencias
+        return viz_suggestions
     
-    def _suggest_deep_dive(self, answer: str, citations: List[Dict]) -> List[Dict[str, Any]]:
+    def _suggest_deep_dive(self, topic_counts: Dict[str, int], documents: Tuple[str, ...]) -> List[DeepDiveSuggestion]:
         """Sugiere análisis más profundos"""
         deep_dive_suggestions = []
+        # Temas de cada documento citado: se calculan una vez, al primer tema que los necesita
+        studies_by_topic = None
         
-        for topic, keywords in self.deep_dive_keywords.items():
-            keyword_count = sum(1 for keyword in keywords if keyword in answer.lower())
+        for topic in self.deep_dive_keywords:
+            keyword_count = topic_counts[topic]
             
             if keyword_count >= 2:  # Al menos 2 keywords del tema
-                template = self.suggestion_templates["deep_dive"].get(topic)
+                template = self._deep_dive_templates.get(topic)
                 if template:
-                    deep_dive_suggestions.append({
-                        "topic": topic,
-                        "description": template,
-                        "relevance_score": keyword_count,
-                        "available_studies": len([c for c in citations if any(kw in c.get("document", "").lower() for kw in keywords)])
-                    })
+                    if studies_by_topic is None:
+                        studies_by_topic = self._count_studies_by_topic(documents)
+                    deep_dive_suggestions.append(DeepDiveSuggestion(
+                        topic=topic,
+                        description=template,
+                        relevance_score=keyword_count,
+                        available_studies=studies_by_topic[topic]
+                    ))
         
         # Ordenar por relevancia
-        deep_dive_suggestions.sort(key=lambda x: x["relevance_score"], reverse=True)
+        deep_dive_suggestions.sort(key=lambda x: x.relevance_score, reverse=True)
         return deep_dive_suggestions[:2]  # Máximo 2 sugerencias
     
-    def _suggest_related_queries(self, answer: str) -> List[Dict[str, Any]]:
+    def _suggest_related_queries(self, topic_counts: Dict[str, int]) -> List[RelatedQuerySuggestion]:
         """Sugiere consultas relacionadas"""
         related_suggestions = []
         
-        for topic, keywords in self.deep_dive_keywords.items():
-            if any(keyword in answer.lower() for keyword in keywords):
-                queries = self.suggestion_templates["related_queries"].get(topic, [])
-                if queries:
-                    related_suggestions.extend([
-                        {
-                            "query": query,
-                            "topic": topic,
-                            "type": "related_question"
-                        } for query in queries[:2]  # Máximo 2 por tema
-                    ])
+        for topic in _RELATED_TOPICS:
+            if topic_counts[topic]:
+                queries = self._related_query_templates[topic]
+                related_suggestions.extend(
+                    RelatedQuerySuggestion(query=query, topic=topic)
+                    for query in queries[:2]  # Máximo 2 por tema
+                )
+                if len(related_suggestions) >= 3:
+                    break
         
         return related_suggestions[:3]  # Máximo 3 total
     
@@ -291,26 +554,22 @@ class IntelligentSuggestionEngine:
     
     def generate_suggestion_text(self, suggestions: Dict[str, Any]) -> str:
         """Genera texto de sugerencias para agregar al final de la respuesta"""
+        return "".join(self.stream_suggestion_text(suggestions))
+    
+    def stream_suggestion_text(self, suggestions: Dict[str, Any]) -> Iterator[str]:
+        """
+        Fragmentos del texto de sugerencias, en orden; sirve para enviarlo en streaming
+        (p. ej. StreamingResponse) sin armar el texto completo
+        """
         if not suggestions["has_suggestions"]:
-            return ""
+            return
         
-        suggestion_text = "\n\n---\n\n### 💡 ¿Qué más te gustaría explorar?\n\n"
+        yield "\n\n---\n\n### 💡 ¿Qué más te gustaría explorar?\n\n"
         
         for category_key, category in suggestions["categories"].items():
-            suggestion_text += f"**{category['title']}**\n"
-            
-            for item in category["items"][:3]:  # Máximo 3 por categoría
-                if category_key == "visualizations":
-                    suggestion_text += f"• {item['description']}\n"
-                elif category_key == "deep_dive":
-                    suggestion_text += f"• {item['description']}\n"
-                elif category_key == "related_queries":
-                    suggestion_text += f"• {item['query']}\n"
-                elif category_key == "follow_up_actions":
-                    suggestion_text += f"• {item['description']}\n"
-            
-            suggestion_text += "\n"
-        
-        suggestion_text += "*Solo menciona qué te interesa y te ayudo a profundizar en esa área.*"
+            # Campo que se muestra de cada item según la categoría
+            field = _SUGGESTION_TEXT_FIELDS.get(category_key)
+            lines = tuple(item[field] for item in category["items"][:3]) if field else ()  # Máximo 3 por categoría
+            yield _render_category(category["title"], lines)
         
-        return suggestion_text
\ No newline at end of file
+        yield "*Solo menciona qué te interesa y te ayudo a profundizar en esa área.*"
\ No newline at end of file
@@ -2,15 +2,32 @@
 """
 Pure Python implementations of math functions to avoid numpy/sklearn dependencies
 For Azure App Service compatibility
+
+numpy is used opportunistically where it is installed; every function keeps its
+pure Python path for Azure App Service deployments that run without it.
 """
 
 import math
+import operator
 from typing import List, Tuple
 
+try:
+    import numpy as np
+except ImportError:  # Azure App Service deployments run without numpy
+    np = None
+
+try:
+    _sumprod = math.sumprod  # Python 3.12+, C loop with extended precision
+except AttributeError:
+    def _sumprod(vec1, vec2):
+        return sum(map(operator.mul, vec1, vec2))
+
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     """
-    Calculate cosine similarity between two vectors using pure Python.
+    Calculate cosine similarity between two vectors.
+
+    Uses numpy.vdot when numpy is available, pure Python otherwise.
     
     Args:
         vec1: First vector as list of floats
@@ -22,12 +39,21 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     if len(vec1) != len(vec2):
         raise ValueError(f"Vectors must have same length. Got {len(vec1)} and {len(vec2)}")
     
+    if np is not None:
+        a = np.asarray(vec1, dtype=np.float64)
+        b = np.asarray(vec2, dtype=np.float64)
+        squared_magnitudes = float(np.vdot(a, a)) * float(np.vdot(b, b))
+        if squared_magnitudes == 0:
+            return 0.0
+        similarity = float(np.vdot(a, b)) / math.sqrt(squared_magnitudes)
+        return max(-1.0, min(1.0, similarity))
+    
     # Calculate dot product
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
+    dot_product = _sumprod(vec1, vec2)
     
     # Calculate magnitudes
-    magnitude1 = math.sqrt(sum(a * a for a in vec1))
-    magnitude2 = math.sqrt(sum(b * b for b in vec2))
+    magnitude1 = math.hypot(*vec1)
+    magnitude2 = math.hypot(*vec2)
     
     # Avoid division by zero
     if magnitude1 == 0 or magnitude2 == 0:
@@ -40,6 +66,49 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     return max(-1.0, min(1.0, similarity))
 
 
+def cosine_similarity_matrix(
+    vectors1: List[List[float]],
+    vectors2: List[List[float]]
+) -> List[List[float]]:
+    """
+    Calculate cosine similarity between every pair of vectors from two lists.
+    
+    Args:
+        vectors1: First list of vectors (rows of the result)
+        vectors2: Second list of vectors (columns of the result)
+        
+    Returns:
+        Matrix as list of rows: result[i][j] = cosine_similarity(vectors1[i], vectors2[j])
+    """
+    lengths = {len(vec) for vec in vectors1} | {len(vec) for vec in vectors2}
+    if len(lengths) > 1:
+        raise ValueError(f"Vectors must have same length. Got {sorted(lengths)}")
+    if not vectors1 or not vectors2:
+        return [[] for _ in vectors1]
+    
+    if np is not None:
+        a = np.asarray(vectors1, dtype=np.float64)
+        b = np.asarray(vectors2, dtype=np.float64)
+        magnitudes = np.outer(np.sqrt(np.einsum("ij,ij->i", a, a)), np.sqrt(np.einsum("ij,ij->i", b, b)))
+        similarities = np.zeros(magnitudes.shape)
+        np.divide(a @ b.T, magnitudes, out=similarities, where=magnitudes != 0)
+        return np.clip(similarities, -1.0, 1.0).tolist()
+    
+    # Magnitudes computed once per vector instead of once per pair
+    magnitudes2 = [math.hypot(*vec) for vec in vectors2]
+    matrix = []
+    for vec1 in vectors1:
+        magnitude1 = math.hypot(*vec1)
+        row = []
+        for vec2, magnitude2 in zip(vectors2, magnitudes2):
+            if magnitude1 == 0 or magnitude2 == 0:
+                row.append(0.0)
+            else:
+                row.append(max(-1.0, min(1.0, _sumprod(vec1, vec2) / (magnitude1 * magnitude2))))
+        matrix.append(row)
+    return matrix
+
+
 def normalize_vector(vec: List[float]) -> List[float]:
     """
     Normalize a vector to unit length.
@@ -50,7 +119,7 @@ def normalize_vector(vec: List[float]) -> List[float]:
     Returns:
         Normalized vector
     """
-    magnitude = math.sqrt(sum(x * x for x in vec))
+    magnitude = math.hypot(*vec)
     if magnitude == 0:
         return vec
     return [x / magnitude for x in vec]
@@ -70,7 +139,7 @@ def euclidean_distance(vec1: List[float], vec2: List[float]) -> float:
     if len(vec1) != len(vec2):
         raise ValueError(f"Vectors must have same length. Got {len(vec1)} and {len(vec2)}")
     
-    return math.sqrt(sum((a - b) ** 2 for a, b in zip(vec1, vec2)))
+    return math.dist(vec1, vec2)
 
 
 def dot_product(vec1: List[float], vec2: List[float]) -> float:
@@ -87,7 +156,7 @@ def dot_product(vec1: List[float], vec2: List[float]) -> float:
     if len(vec1) != len(vec2):
         raise ValueError(f"Vectors must have same length. Got {len(vec1)} and {len(vec2)}")
     
-    return sum(a * b for a, b in zip(vec1, vec2))
+    return _sumprod(vec1, vec2)
 
 
 def vector_mean(vectors: List[List[float]]) -> List[float]:
@@ -106,18 +175,11 @@ def vector_mean(vectors: List[List[float]]) -> List[float]:
     num_vectors = len(vectors)
     vector_length = len(vectors[0])
     
-    # Initialize mean vector with zeros
-    mean = [0.0] * vector_length
+    if any(len(vector) != vector_length for vector in vectors):
+        raise ValueError("All vectors must have the same length")
     
-    # Sum all vectors
-    for vector in vectors:
-        if len(vector) != vector_length:
-            raise ValueError("All vectors must have the same length")
-        for i in range(vector_length):
-            mean[i] += vector[i]
-    
-    # Divide by number of vectors
-    return [x / num_vectors for x in mean]
+    # Sum each component across vectors (column-wise), then divide by number of vectors
+    return [sum(column) / num_vectors for column in zip(*vectors)]
 
 
 def top_k_similar(
@@ -136,10 +198,22 @@ def top_k_similar(
     Returns:
         List of (id, similarity_score) tuples, sorted by similarity
     """
+    if np is not None and vectors:
+        return _top_k_similar_numpy(query_vector, vectors, k)
+    
     similarities = []
     
+    # Query magnitude computed once instead of once per candidate
+    query_magnitude = math.hypot(*query_vector)
+    
     for vec_id, vec in vectors:
-        similarity = cosine_similarity(query_vector, vec)
+        if len(vec) != len(query_vector):
+            raise ValueError(f"Vectors must have same length. Got {len(query_vector)} and {len(vec)}")
+        magnitude = math.hypot(*vec)
+        if query_magnitude == 0 or magnitude == 0:
+            similarity = 0.0
+        else:
+            similarity = max(-1.0, min(1.0, _sumprod(query_vector, vec) / (query_magnitude * magnitude)))
         similarities.append((vec_id, similarity))
     
     # Sort by similarity (highest first)
@@ -148,6 +222,39 @@ def top_k_similar(
     return similarities[:k]
 
 
+def _top_k_similar_numpy(
+    query_vector: List[float],
+    vectors: List[Tuple[str, List[float]]],
+    k: int
+) -> List[Tuple[str, float]]:
+    """
+    top_k_similar for numpy: one matrix-vector product for all scores.
+    
+    Ties keep input order, as with the stable sort of the pure Python path.
+    """
+    query = np.asarray(query_vector, dtype=np.float64)
+    matrix = np.asarray([vec for _, vec in vectors], dtype=np.float64)
+    if matrix.ndim != 2 or matrix.shape[1] != len(query):
+        width = matrix.shape[1] if matrix.ndim == 2 else 0
+        raise ValueError(f"Vectors must have same length. Got {len(query)} and {width}")
+    
+    # Cosine similarity of every row against the query, 0.0 for zero-magnitude vectors
+    magnitudes = np.sqrt(np.einsum("ij,ij->i", matrix, matrix)) * math.sqrt(float(np.vdot(query, query)))
+    scores = np.zeros(len(vectors))
+    np.divide(matrix @ query, magnitudes, out=scores, where=magnitudes != 0)
+    np.clip(scores, -1.0, 1.0, out=scores)
+    
+    if 0 < k < len(scores):
+        # Keep every candidate tied with the k-th best score, then sort only those
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(len(scores))
+    order = candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+    
+    return [(vectors[i][0], float(scores[i])) for i in order]
+
+
 # Test functions to ensure correctness
 def _test_cosine_similarity():
     """Test cosine similarity implementation"""
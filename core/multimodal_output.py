@@ -7,6 +7,8 @@ Generates text, images, tables, and charts using Azure OpenAI
 import os
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import re
@@ -38,6 +40,11 @@ class MultimodalOutputGenerator:
             "background": "#DBEAFE"
         }
         
+        # Shared HTTP session - keep-alive connections avoid a TLS handshake per request.
+        # Chat and image generations are not idempotent, so nothing is retried here.
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        
         print("✅ Multimodal Output Generator initialized")
         print(f"   📊 Chart types: bar, line, pie, scatter, table")
         print(f"   🎨 Brand colors: {len(self.brand_colors)} Tigo colors")
@@ -79,23 +86,33 @@ class MultimodalOutputGenerator:
             # Analyze if data visualization would be valuable
             should_visualize = self._should_generate_visualization(query, text_response["content"], mode)
             
-            # Generate requested outputs
+            # Select requested outputs (each one is an independent Azure OpenAI call)
+            generations = []
             for output_type in output_types:
+                if output_type == "table" and ("table" in query.lower() or should_visualize):
+                    generations.append((output_type, "tables", self._generate_table,
+                                        (query, context, text_response["content"])))
+                
+                elif output_type == "chart" and should_visualize:
+                    generations.append((output_type, "charts", self._generate_chart,
+                                        (query, context, text_response["content"])))
+                
+                elif output_type == "image" and (mode == "creative" or "imagen" in query.lower()):
+                    generations.append((output_type, "images", self._generate_image,
+                                        (query, text_response["content"])))
+            
+            # Run them concurrently; results are collected in request order
+            if len(generations) > 1:
+                with ThreadPoolExecutor(max_workers=len(generations)) as executor:
+                    futures = [executor.submit(generate, *args) for _, _, generate, args in generations]
+            else:
+                futures = None
+            
+            for index, (output_type, key, generate, args) in enumerate(generations):
                 try:
-                    if output_type == "table" and ("table" in query.lower() or should_visualize):
-                        table = self._generate_table(query, context, text_response["content"])
-                        if table:
-                            response_data["tables"].append(table)
-                    
-                    elif output_type == "chart" and should_visualize:
-                        chart = self._generate_chart(query, context, text_response["content"])
-                        if chart:
-                            response_data["charts"].append(chart)
-                    
-                    elif output_type == "image" and (mode == "creative" or "imagen" in query.lower()):
-                        image = self._generate_image(query, text_response["content"])
-                        if image:
-                            response_data["images"].append(image)
+                    output = futures[index].result() if futures else generate(*args)
+                    if output:
+                        response_data[key].append(output)
                 
                 except Exception as e:
                     print(f"⚠️ Error generating {output_type}: {e}")
@@ -160,7 +177,7 @@ PREGUNTA: {query}"""
             
             url = f"{self.azure_config['endpoint']}/openai/deployments/{self.azure_config['chat_deployment']}/chat/completions?api-version={self.azure_config['api_version']}"
             
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = self._session.post(url, headers=headers, json=payload, timeout=60)
             response.raise_for_status()
             
             result = response.json()
@@ -242,7 +259,7 @@ Formato de respuesta:
             
             url = f"{self.azure_config['endpoint']}/openai/deployments/{self.azure_config['chat_deployment']}/chat/completions?api-version={self.azure_config['api_version']}"
             
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            response = self._session.post(url, headers=headers, json=payload, timeout=30)
             response.raise_for_status()
             
             result = response.json()
@@ -307,7 +324,7 @@ Crea configuración de gráfico en formato JSON:
             
             url = f"{self.azure_config['endpoint']}/openai/deployments/{self.azure_config['chat_deployment']}/chat/completions?api-version={self.azure_config['api_version']}"
             
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            response = self._session.post(url, headers=headers, json=payload, timeout=30)
             response.raise_for_status()
             
             result = response.json()
@@ -396,7 +413,7 @@ Elementos a incluir:
             
             url = f"{self.azure_config['endpoint']}/openai/deployments/{self.azure_config['dalle_deployment']}/images/generations?api-version={self.azure_config['api_version']}"
             
-            response = requests.post(url, headers=headers, json=payload, timeout=120)
+            response = self._session.post(url, headers=headers, json=payload, timeout=120)
             response.raise_for_status()
             
             result = response.json()
@@ -7,11 +7,13 @@ Each accepts multimodal input and generates multimodal output
 
 import os
 import json
+import logging
 import uvicorn
 import requests
 from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import base64
@@ -24,6 +26,9 @@ try:
 except ImportError:
     print("⚠️ python-dotenv not installed, using system environment variables")
 
+# Logging for core modules (LOG_LEVEL=DEBUG enables per-search diagnostics)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
 from core.azure_search_vector_store import AzureSearchVectorStore
 from core.multimodal_processor import MultimodalInputProcessor
 from core.multimodal_output import MultimodalOutputGenerator
@@ -611,7 +616,7 @@ async def rag_pure_endpoint(query: MultimodalQuery):
     if not rag_system:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
-    return rag_system.process_multimodal_query(query, "pure")
+    return await run_in_threadpool(rag_system.process_multimodal_query, query, "pure")
 
 
 @app.post("/api/rag-creative", response_model=RAGResponse)
@@ -622,7 +627,7 @@ async def rag_creative_endpoint(query: MultimodalQuery):
     if not rag_system:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
-    return rag_system.process_multimodal_query(query, "creative")
+    return await run_in_threadpool(rag_system.process_multimodal_query, query, "creative")
 
 
 @app.post("/api/rag-hybrid", response_model=RAGResponse)
@@ -633,7 +638,7 @@ async def rag_hybrid_endpoint(query: MultimodalQuery):
     if not rag_system:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
-    return rag_system.process_multimodal_query(query, "hybrid")
+    return await run_in_threadpool(rag_system.process_multimodal_query, query, "hybrid")
 
 
 # Endpoint específico para el frontend - compatible con el formato esperado
@@ -673,8 +678,8 @@ async def chat_endpoint_for_frontend(request: Dict[str, Any]):
             output_types=["text", "table", "chart"] if mode == "creative" else ["text"]
         )
         
-        # Procesar con el sistema RAG
-        response = rag_system.process_multimodal_query(multimodal_query, backend_mode)
+        # Procesar con el sistema RAG (el pipeline hace HTTP bloqueante: fuera del event loop)
+        response = await run_in_threadpool(rag_system.process_multimodal_query, multimodal_query, backend_mode)
         
         # Reformatear respuesta para el frontend
         return {